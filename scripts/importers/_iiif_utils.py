@@ -0,0 +1,1117 @@
+"""
+Shared helpers for the Compilatio IIIF importers.
+
+The importer scripts are run directly (python scripts/importers/nls.py), so
+this module sits on sys.path next to them and is imported as `_iiif_utils`.
+
+Optional dependencies:
+    pip install orjson      # faster JSON decoding; stdlib json is the fallback
+    pip install ijson       # streaming manifest decoding (lower peak memory)
+    pip install lxml        # faster BeautifulSoup tree builder than html.parser
+    pip install aiohttp     # concurrent manifest fetching (fetch_manifests_async)
+"""
+
+import asyncio
+import gzip
+import hashlib
+import http.client
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, Optional
+from urllib.error import HTTPError, URLError
+from urllib.parse import urljoin, urlsplit
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# Importers fall back to sequential urllib fetching without aiohttp
+ASYNC_HTTP_AVAILABLE = aiohttp is not None
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+logger = logging.getLogger(__name__)
+
+# Project paths
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+MANIFEST_CACHE_DIR = PROJECT_ROOT / ".cache" / "iiif"
+
+
+# =============================================================================
+# JSON
+# =============================================================================
+
+
+def json_loads(data):
+    """Decode JSON from bytes or str (orjson errors subclass JSONDecodeError)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(obj, indent: bool = False) -> bytes:
+    """Encode JSON to UTF-8 bytes, optionally indented by two spaces."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False).encode()
+
+
+# =============================================================================
+# Persistent HTTP Connections
+# =============================================================================
+# urlopen() opens a new TCP (and TLS) connection per request. http_get keeps
+# one http.client connection per host per thread and reuses it, so a run of
+# manifest fetches against the same IIIF server pays for the handshake once.
+# Responses are requested gzip-compressed (JSON manifests shrink several-fold)
+# and decompressed before they are returned.
+
+_connections = threading.local()
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+MAX_REDIRECTS = 5
+
+
+class HTTPResponse:
+    """Fully read response from http_get (usable as a context manager)."""
+
+    def __init__(self, url: str, status: int, headers, body: bytes):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self._body = body
+
+    def read(self) -> bytes:
+        return self._body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def _get_connection(scheme: str, netloc: str, timeout: float):
+    pool = _connections.__dict__.setdefault("pool", {})
+    conn = pool.get((scheme, netloc))
+    if conn is None:
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(netloc, timeout=timeout)
+        else:
+            conn = http.client.HTTPConnection(netloc, timeout=timeout)
+        pool[(scheme, netloc)] = conn
+    return conn
+
+
+def _drop_connection(scheme: str, netloc: str):
+    conn = _connections.__dict__.get("pool", {}).pop((scheme, netloc), None)
+    if conn is not None:
+        conn.close()
+
+
+def _request_once(url: str, headers: dict, timeout: float):
+    parts = urlsplit(url)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+
+    # A kept-alive connection may have been closed by the server while idle;
+    # retry once on a fresh connection before giving up.
+    for attempt in range(2):
+        conn = _get_connection(parts.scheme, parts.netloc, timeout)
+        try:
+            conn.request("GET", path, headers=headers)
+            resp = conn.getresponse()
+            body = resp.read()
+        except (http.client.HTTPException, OSError) as e:
+            _drop_connection(parts.scheme, parts.netloc)
+            if attempt == 0:
+                continue
+            raise URLError(e)
+        if resp.will_close:
+            _drop_connection(parts.scheme, parts.netloc)
+        return resp.status, resp.reason, resp.headers, body
+
+
+def http_get(url: str, headers: Optional[dict] = None, timeout: float = 30) -> HTTPResponse:
+    """
+    GET a URL over a reused keep-alive connection.
+
+    Follows redirects like urlopen and raises the same urllib HTTPError
+    (including for 304) and URLError, so callers can swap it in directly.
+    Asks for gzip unless the caller sets Accept-Encoding; read() always
+    returns the decoded body.
+    """
+    headers = {"Accept-Encoding": "gzip", **(headers or {})}
+    for _ in range(MAX_REDIRECTS + 1):
+        status, reason, resp_headers, body = _request_once(url, headers, timeout)
+        if status in REDIRECT_STATUSES and resp_headers.get("Location"):
+            url = urljoin(url, resp_headers["Location"])
+            continue
+        if status >= 300:
+            raise HTTPError(url, status, reason, resp_headers, None)
+        if resp_headers.get("Content-Encoding", "").lower() == "gzip":
+            try:
+                body = gzip.decompress(body)
+            except (OSError, EOFError) as e:
+                raise URLError(f"Bad gzip body from {url}: {e}")
+        return HTTPResponse(url, status, resp_headers, body)
+    raise URLError(f"Too many redirects: {url}")
+
+
+# =============================================================================
+# Rate Limiting
+# =============================================================================
+
+
+# Statuses that mean "slow down and try again"
+RETRY_STATUSES = {429, 503}
+MAX_RETRIES = 4
+
+
+class RateLimiter:
+    """
+    Space requests at least min_interval seconds apart across threads.
+
+    Each caller reserves the next free slot under a lock and then sleeps
+    outside it, so worker threads queue up without holding the lock. With
+    burst > 1 it acts as a token bucket: after an idle spell up to burst
+    requests go out back to back before the steady spacing applies. The
+    spacing widens when the server reports its own limit through
+    X-RateLimit-Remaining / X-RateLimit-Reset, and defer() holds every
+    worker back after a 429 or 503.
+    """
+
+    def __init__(self, min_interval: float, burst: int = 1):
+        self.min_interval = min_interval
+        self.burst = burst
+        self._interval = min_interval
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            # Unused slots from an idle spell carry over, up to burst - 1
+            earliest = now - (self.burst - 1) * self._interval
+            slot = max(earliest, self._next_slot)
+            self._next_slot = slot + self._interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def defer(self, delay: float):
+        """Hold back all requests for at least delay seconds."""
+        with self._lock:
+            self._next_slot = max(self._next_slot, time.monotonic() + delay)
+
+    def update(self, headers):
+        """Adjust spacing from X-RateLimit-* response headers, if present."""
+        if headers is None:
+            return
+        try:
+            remaining = int(headers.get("X-RateLimit-Remaining"))
+            reset = float(headers.get("X-RateLimit-Reset"))
+        except (TypeError, ValueError):
+            return
+
+        if reset > 1e9:
+            reset -= time.time()  # Epoch timestamp rather than seconds
+        reset = max(reset, 0.0)
+
+        with self._lock:
+            if remaining <= 0:
+                self._next_slot = max(self._next_slot, time.monotonic() + reset)
+                self._interval = self.min_interval
+            else:
+                self._interval = max(self.min_interval, reset / remaining)
+
+
+class AsyncRateLimiter:
+    """
+    Token bucket for asyncio fetchers: up to `burst` requests at once, then
+    `rate` per second.
+
+    Like RateLimiter, it slows to the server's advertised X-RateLimit-*
+    budget (never above `rate`) and defer() pauses everyone after a 429/503.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.last_refill) * self.rate
+                )
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def defer(self, delay: float):
+        """Hold back all requests for at least delay seconds."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+
+    def update(self, headers):
+        """Adjust the refill rate from X-RateLimit-* response headers."""
+        if headers is None:
+            return
+        try:
+            remaining = int(headers.get("X-RateLimit-Remaining"))
+            reset = float(headers.get("X-RateLimit-Reset"))
+        except (TypeError, ValueError):
+            return
+
+        if reset > 1e9:
+            reset -= time.time()  # Epoch timestamp rather than seconds
+        reset = max(reset, 0.0)
+
+        if remaining <= 0:
+            self.defer(reset)
+            self.rate = self.max_rate
+        elif reset > 0:
+            self.rate = min(self.max_rate, remaining / reset)
+
+
+def retry_delay(attempt: int, headers=None, base: float = 1.0) -> float:
+    """Seconds to wait before retry number attempt (0-based)."""
+    retry_after = headers.get("Retry-After") if headers is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass  # HTTP-date form; fall back to exponential backoff
+    return base * 2 ** attempt + random.uniform(0, base)
+
+
+# =============================================================================
+# Manifest Decoding
+# =============================================================================
+
+# Top-level manifest keys the importers read. Everything else (notably the
+# full canvas list under "sequences") is skipped, keeping only its length.
+MANIFEST_KEYS = {"@id", "label", "description", "metadata", "thumbnail"}
+FIRST_CANVAS_PREFIX = "sequences.item.canvases.item"
+# Below this size a full orjson/json decode is faster than streaming with
+# ijson, and the discarded canvases cost little memory.
+STREAM_MIN_BYTES = 512 * 1024
+
+
+def _trim_manifest(manifest: dict) -> dict:
+    """Reduce a decoded manifest to MANIFEST_KEYS plus its first canvas."""
+    subset = {k: v for k, v in manifest.items() if k in MANIFEST_KEYS}
+    sequences = manifest.get("sequences") or []
+    canvases = sequences[0].get("canvases", []) if sequences else []
+    if canvases:
+        subset["sequences"] = [{"canvases": canvases[:1]}]
+    subset["canvas_count"] = len(canvases)
+    return subset
+
+
+def _stream_manifest(raw: bytes) -> dict:
+    """Build the trimmed manifest from ijson events in a single pass."""
+    subset = {}
+    first_canvas = None
+    wanted = None
+    builder = None
+    depth = 0
+    sequences_seen = 0
+    canvas_count = 0
+
+    for prefix, event, value in ijson.parse(raw, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if event in ("start_map", "start_array"):
+                depth += 1
+            elif event in ("end_map", "end_array"):
+                depth -= 1
+            if depth == 0:
+                if wanted:
+                    subset[wanted] = builder.value
+                else:
+                    first_canvas = builder.value
+                builder = None
+                wanted = None
+            continue
+
+        if prefix == "" and event == "map_key":
+            wanted = value if value in MANIFEST_KEYS else None
+            continue
+
+        if event == "start_map":
+            if prefix == "sequences.item":
+                sequences_seen += 1
+            elif prefix == FIRST_CANVAS_PREFIX and sequences_seen == 1:
+                canvas_count += 1
+
+        if (wanted and prefix == wanted) or (
+            prefix == FIRST_CANVAS_PREFIX
+            and event == "start_map"
+            and first_canvas is None
+        ):
+            if prefix == FIRST_CANVAS_PREFIX:
+                wanted = None
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            depth = 1 if event in ("start_map", "start_array") else 0
+            if depth == 0:
+                subset[wanted] = builder.value
+                builder = None
+                wanted = None
+
+    if first_canvas is not None:
+        subset["sequences"] = [{"canvases": [first_canvas]}]
+    subset["canvas_count"] = canvas_count
+    return subset
+
+
+def load_manifest_subset(raw: bytes) -> dict:
+    """
+    Decode only the parts of a IIIF manifest the importers use.
+
+    Returns a dict with label, description, metadata and thumbnail, a
+    "sequences" list holding just the first canvas (for thumbnail lookup),
+    and "canvas_count", the length of the first sequence. Manifests of at
+    least STREAM_MIN_BYTES are streamed with ijson, when installed, so the
+    canvas list is never materialised; smaller ones (or all, without
+    ijson) are decoded in full and then trimmed.
+    """
+    if ijson is not None and len(raw) >= STREAM_MIN_BYTES:
+        try:
+            return _stream_manifest(raw)
+        except ijson.JSONError:
+            pass  # Let the full decoder raise a proper JSONDecodeError
+    return _trim_manifest(json_loads(raw))
+
+
+# =============================================================================
+# Manifest Fetching (urllib)
+# =============================================================================
+
+
+def fetch_json_cached(
+    url: str,
+    user_agent: str,
+    use_cache: bool = True,
+    refresh: bool = False,
+    limiter: Optional[RateLimiter] = None,
+    decode=load_manifest_subset,
+    retry_statuses: set[int] = RETRY_STATUSES,
+    retry_base: float = 1.0,
+    not_found=None,
+) -> Optional[dict]:
+    """
+    Fetch and decode one JSON document through the on-disk manifest cache.
+
+    A cache hit skips HTTP entirely. With refresh, cached entries are
+    revalidated using their stored ETag/Last-Modified, so an unchanged
+    manifest costs a 304 instead of a full download. Responses with a
+    status in retry_statuses and network errors are retried with
+    exponential backoff (retry_base seconds, doubling), honouring
+    Retry-After. If a limiter is given it paces every attempt and slows
+    down when the server reports X-RateLimit-Remaining / X-RateLimit-Reset.
+    A 404 is a failure like any other unless not_found is given, in which
+    case it is returned without a warning (see fetch_json_async).
+    """
+    cached = read_cached_manifest(url) if use_cache else None
+    if cached is not None and not refresh:
+        try:
+            return decode(cached)
+        except json.JSONDecodeError:
+            cached = None  # Corrupt entry, fetch again
+
+    headers = {"User-Agent": user_agent}
+    if cached is not None:
+        headers.update(cache_validators(url))
+
+    for attempt in range(MAX_RETRIES + 1):
+        if limiter is not None:
+            limiter.wait()
+
+        try:
+            with http_get(url, headers) as resp:
+                if limiter is not None:
+                    limiter.update(resp.headers)
+                raw = resp.read()
+                data = decode(raw)
+                if use_cache:
+                    write_cached_manifest(url, raw, resp.headers)
+                return data
+        except HTTPError as e:
+            if e.code == 304 and cached is not None:
+                logger.debug(f"Not modified: {url}")
+                try:
+                    return decode(cached)
+                except json.JSONDecodeError:
+                    # Corrupt entry; fetch it again without the validators
+                    cached = None
+                    headers = {"User-Agent": user_agent}
+                    continue
+            if e.code == 404 and not_found is not None:
+                logger.debug(f"Not found: {url}")
+                return not_found
+            if e.code not in retry_statuses or attempt == MAX_RETRIES:
+                logger.warning(f"Failed to fetch {url}: {e}")
+                return None
+            delay = retry_delay(attempt, e.headers, base=retry_base)
+        except (URLError, TimeoutError) as e:
+            if attempt == MAX_RETRIES:
+                logger.warning(f"Failed to fetch {url}: {e}")
+                return None
+            delay = retry_delay(attempt, base=retry_base)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Failed to fetch {url}: {e}")
+            return None
+
+        logger.debug(f"Retry {attempt + 1}/{MAX_RETRIES} for {url} in {delay:.1f}s")
+        if limiter is not None:
+            limiter.defer(delay)
+        else:
+            time.sleep(delay)
+
+    return None
+
+
+def iter_manifests_sync(
+    urls: list[str], user_agent: str, limiter: RateLimiter, **kwargs,
+) -> Iterator[Optional[dict]]:
+    """
+    Yield manifests in order using urllib (fallback without aiohttp).
+
+    The next manifest is fetched on a background thread while the caller
+    parses the current one, so parsing overlaps the network wait. Cache
+    hits are not delayed; network requests are paced by limiter. Keyword
+    arguments are passed on to fetch_json_cached.
+    """
+    if not urls:
+        return
+
+    def fetch(url: str) -> Optional[dict]:
+        return fetch_json_cached(url, user_agent, limiter=limiter, **kwargs)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = executor.submit(fetch, urls[0])
+        for i in range(len(urls)):
+            data = pending.result()
+            if i + 1 < len(urls):
+                pending = executor.submit(fetch, urls[i + 1])
+            if (i + 1) % 25 == 0:
+                logger.info(f"Progress: {i+1}/{len(urls)} manifests fetched")
+            yield data
+
+
+# =============================================================================
+# Async Manifest Fetching (aiohttp)
+# =============================================================================
+
+
+async def fetch_json_async(
+    session,
+    semaphore: asyncio.Semaphore,
+    url: str,
+    use_cache: bool = True,
+    refresh: bool = False,
+    limiter: Optional[AsyncRateLimiter] = None,
+    decode=load_manifest_subset,
+    not_found=None,
+    retry_statuses: set[int] = RETRY_STATUSES,
+) -> Optional[dict]:
+    """
+    Fetch and decode one JSON document with aiohttp.
+
+    Goes through the manifest disk cache (with conditional revalidation on
+    refresh) and, like fetch_json_cached, retries responses with a status
+    in retry_statuses and connection errors or timeouts with backoff.
+    The semaphore bounds how many requests are in flight and the limiter,
+    if given, paces them. A 404 is a failure like
+    any other unless not_found is given, in which case it is returned
+    without a warning (for importers that probe candidate URLs).
+    """
+    cached = read_cached_manifest(url) if use_cache else None
+    if cached is not None and not refresh:
+        try:
+            return decode(cached)
+        except json.JSONDecodeError:
+            cached = None  # Corrupt entry, fetch again
+
+    headers = cache_validators(url) if cached is not None else {}
+
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            async with semaphore:
+                if limiter is not None:
+                    await limiter.acquire()
+                async with session.get(url, headers=headers) as resp:
+                    if limiter is not None:
+                        limiter.update(resp.headers)
+                    if resp.status == 304 and cached is not None:
+                        logger.debug(f"Not modified: {url}")
+                        return decode(cached)
+                    if resp.status == 404 and not_found is not None:
+                        logger.debug(f"Not found: {url}")
+                        return not_found
+                    if resp.status in retry_statuses and attempt < MAX_RETRIES:
+                        delay = retry_delay(attempt, resp.headers)
+                        logger.info(
+                            f"HTTP {resp.status} for {url}, retrying in {delay:.1f}s"
+                        )
+                    else:
+                        resp.raise_for_status()
+                        raw = await resp.read()
+                        data = decode(raw)
+                        if use_cache:
+                            write_cached_manifest(url, raw, resp.headers)
+                        return data
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if attempt == MAX_RETRIES:
+                logger.warning(f"Failed to fetch {url}: {e}")
+                return None
+            delay = retry_delay(attempt)
+            logger.debug(f"Retry {attempt + 1}/{MAX_RETRIES} for {url} in {delay:.1f}s")
+        except (aiohttp.ClientError, json.JSONDecodeError) as e:
+            logger.warning(f"Failed to fetch {url}: {e}")
+            return None
+
+        if limiter is not None:
+            limiter.defer(delay)
+        await asyncio.sleep(delay)
+
+    return None
+
+
+async def fetch_manifests_async(
+    urls: list[str],
+    user_agent: str,
+    max_concurrency: int = 16,
+    rate: float = 10.0,
+    use_cache: bool = True,
+    refresh: bool = False,
+    decode=load_manifest_subset,
+    on_result=None,
+    not_found=None,
+    retry_statuses: set[int] = RETRY_STATUSES,
+) -> Optional[list[Optional[dict]]]:
+    """
+    Fetch many manifests concurrently over one keep-alive aiohttp session.
+
+    At most max_concurrency requests are in flight, paced to `rate` per
+    second after an initial burst. Returns results in the order of urls,
+    with None for failures (and not_found, if given, for 404s; see
+    fetch_json_async). retry_statuses widens or narrows the statuses that
+    are retried with backoff. on_result, if given, is a coroutine function
+    awaited as on_result(index, manifest) as each fetch completes; results
+    are then only handed to it, not kept, and None is returned.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limiter = AsyncRateLimiter(rate, burst=max_concurrency)
+    connector = aiohttp.TCPConnector(
+        limit_per_host=max_concurrency, keepalive_timeout=30,
+    )
+    done = 0
+
+    async def fetch_one(index: int, url: str) -> Optional[dict]:
+        nonlocal done
+        try:
+            data = await fetch_json_async(
+                session, semaphore, url,
+                use_cache=use_cache, refresh=refresh, limiter=limiter,
+                decode=decode, not_found=not_found,
+                retry_statuses=retry_statuses,
+            )
+        except Exception as e:
+            logger.warning(f"Failed to fetch {url}: {e}")
+            data = None
+        done += 1
+        if done % 25 == 0:
+            logger.info(f"Progress: {done}/{len(urls)} manifests fetched")
+        if on_result is not None:
+            await on_result(index, data)
+            return None
+        return data
+
+    async with aiohttp.ClientSession(
+        connector=connector,
+        headers={"User-Agent": user_agent},
+        timeout=aiohttp.ClientTimeout(total=30),
+    ) as session:
+        results = await asyncio.gather(
+            *(fetch_one(i, url) for i, url in enumerate(urls))
+        )
+    return results if on_result is None else None
+
+
+def iter_manifests_background(
+    urls: list[str], user_agent: str, queue_size: int = 200, **kwargs,
+) -> Iterator[tuple[int, Optional[dict]]]:
+    """
+    Yield (index, manifest) pairs in completion order while
+    fetch_manifests_async runs on a background thread.
+
+    Lets the caller parse and write each manifest while the rest are still
+    downloading. The queue is bounded, so a slow consumer pauses fetching
+    instead of buffering every manifest; a full queue is waited on from a
+    worker thread, so the event loop (and the timeouts of requests in
+    flight) keeps running meanwhile. If the caller stops iterating early,
+    the fetch is abandoned. Keyword arguments are passed on to
+    fetch_manifests_async.
+    """
+    results = queue.Queue(maxsize=queue_size)
+    finished = object()
+    stop = threading.Event()
+    errors = []
+
+    def put_blocking(item) -> bool:
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    async def hand_off(index: int, data: Optional[dict]):
+        try:
+            results.put_nowait((index, data))
+            return
+        except queue.Full:
+            pass
+        if not await asyncio.to_thread(put_blocking, (index, data)):
+            raise asyncio.CancelledError  # Consumer gone; abandon the fetch
+
+    def run():
+        try:
+            asyncio.run(fetch_manifests_async(
+                urls, user_agent, on_result=hand_off, **kwargs,
+            ))
+        except BaseException as e:
+            if not stop.is_set():
+                errors.append(e)
+        finally:
+            put_blocking(finished)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            result = results.get()
+            if result is finished:
+                break
+            yield result
+    finally:
+        stop.set()
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
+# =============================================================================
+# Metadata
+# =============================================================================
+# IIIF Presentation 2 metadata labels and values may be a plain string, a
+# {"@value": ...} language map, or a list of either. Each entry is normalised
+# once into a label -> value dict so lookups are a single dict.get().
+
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def _normalize_label(raw) -> str:
+    """Flatten a metadata label to a lower-cased lookup key."""
+    if type(raw) is list:
+        raw = raw[0] if raw else ""
+    if type(raw) is dict:
+        # IIIF 2 {"@value": ...}, or a IIIF 3 language map {"en": [...]}
+        raw = raw.get("@value") or (raw.get("en") or [""])[0]
+    return str(raw).lower().strip()
+
+
+def _normalize_value(raw) -> str:
+    """Flatten a metadata value to plain text, stripping HTML tags."""
+    if type(raw) is list:
+        first_dict = next((v for v in raw if type(v) is dict), None)
+        if first_dict is not None:
+            raw = first_dict  # Multi-language value: take the first language
+        else:
+            raw = "; ".join(str(v) for v in raw)
+    if type(raw) is dict:
+        raw = raw.get("@value", str(raw))
+    value = HTML_TAG_RE.sub(' ', str(raw))
+    return ' '.join(value.split())
+
+
+def index_metadata(metadata: list[dict]) -> dict[str, str]:
+    """
+    Build a label -> value index from a IIIF metadata array.
+
+    Keys are lower-cased labels; when a label repeats, the first entry wins.
+    A multilingual label list (NLW gives English and Welsh) indexes the
+    value under every language's label.
+    """
+    index = {}
+    for entry in metadata:
+        raw = entry.get("label", "")
+        labels = raw if type(raw) is list else (raw,)
+        value = None
+        for label in labels:
+            key = _normalize_label(label)
+            if key not in index:
+                if value is None:
+                    value = _normalize_value(entry.get("value", ""))
+                index[key] = value
+    return index
+
+
+def metadata_value(index: dict[str, str], label: str) -> Optional[str]:
+    """Look up a label in an index_metadata() dict; empty values are None."""
+    return index.get(label.lower()) or None
+
+
+# =============================================================================
+# Manifest Disk Cache
+# =============================================================================
+# Raw manifest bytes are stored under MANIFEST_CACHE_DIR, one file per URL,
+# named by the SHA-256 of the URL. A sibling .meta file keeps the ETag and
+# Last-Modified headers so a refresh can revalidate with a conditional GET.
+
+
+def manifest_cache_path(url: str, cache_dir: Path = MANIFEST_CACHE_DIR) -> Path:
+    """Return the cache file path for a manifest URL."""
+    return cache_dir / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+
+
+def read_cached_manifest(url: str, cache_dir: Path = MANIFEST_CACHE_DIR) -> Optional[bytes]:
+    """Return cached manifest bytes, or None on a miss."""
+    try:
+        return manifest_cache_path(url, cache_dir).read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def cache_validators(url: str, cache_dir: Path = MANIFEST_CACHE_DIR) -> dict:
+    """Return If-None-Match / If-Modified-Since headers for a cached manifest."""
+    meta_path = manifest_cache_path(url, cache_dir).with_suffix(".meta")
+    try:
+        meta = json.loads(meta_path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+
+def _atomic_write(path: Path, data: bytes):
+    """Write bytes to path via a temp file so readers never see a partial file."""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def write_cached_manifest(
+    url: str,
+    raw: bytes,
+    headers=None,
+    cache_dir: Path = MANIFEST_CACHE_DIR,
+):
+    """Store raw manifest bytes (and any ETag/Last-Modified) in the cache."""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    path = manifest_cache_path(url, cache_dir)
+    _atomic_write(path, raw)
+
+    if headers is not None:
+        meta = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+        }
+        _atomic_write(path.with_suffix(".meta"), json.dumps(meta).encode())
+
+
+# =============================================================================
+# Import Progress
+# =============================================================================
+# Resumable importers keep a JSON checkpoint with one list of keys per
+# outcome (e.g. completed_druids / failed_druids). The checkpoint is only
+# rewritten now and then; in between, each outcome is appended as one line
+# ("<kind> <key>", e.g. "C <druid>") to a sibling .log file, which load()
+# replays on top of the checkpoint and save() clears. In memory the key
+# lists are sets; they are written out as sorted lists.
+
+
+class ImportProgress(dict):
+    """
+    Progress dict backed by a JSON checkpoint and an append-only event log.
+
+    events maps each one-letter event kind to the progress field holding
+    the keys with that outcome, e.g. {"C": "completed_ids", "F": "failed_ids"}.
+    A key is in at most one of those sets: recording an outcome moves it
+    out of the others. Other fields (counters, phase) are stored as given.
+    """
+
+    def __init__(self, path: Path, events: dict[str, str], data: Optional[dict] = None):
+        super().__init__({"last_updated": None, **(data or {})})
+        self.path = path
+        self.events = events
+        for field in events.values():
+            self[field] = set(self.get(field, ()))
+
+    @classmethod
+    def load(
+        cls, path: Path, events: dict[str, str], defaults: Optional[dict] = None,
+    ) -> "ImportProgress":
+        """Load the checkpoint at path (or start from defaults) and replay its log."""
+        data = json_loads(path.read_bytes()) if path.exists() else defaults
+        progress = cls(path, events, data)
+        try:
+            with open(progress.log_path) as f:
+                for line in f:
+                    kind, _, key = line.strip().partition(" ")
+                    if kind in events:
+                        progress.record(kind, key)
+        except FileNotFoundError:
+            pass
+        return progress
+
+    @property
+    def log_path(self) -> Path:
+        """Append-only event log kept next to the JSON checkpoint."""
+        return self.path.with_suffix(".log")
+
+    def record(self, kind: str, key: str):
+        """Record an outcome in memory."""
+        for event_kind, field in self.events.items():
+            if event_kind == kind:
+                self[field].add(key)
+            else:
+                self[field].discard(key)
+
+    def mark(self, kind: str, key: str):
+        """Record an outcome and append it to the event log, synced to disk."""
+        self.record(kind, key)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.log_path, "a") as f:
+            f.write(f"{kind} {key}\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def save(self):
+        """Write a full checkpoint atomically and clear the event log it covers."""
+        self["last_updated"] = datetime.now(timezone.utc).isoformat()
+        snapshot = dict(self)
+        for field in self.events.values():
+            snapshot[field] = sorted(self[field])
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        _atomic_write(self.path, json_dumps(snapshot, indent=True))
+        self.log_path.unlink(missing_ok=True)
+
+
+# =============================================================================
+# Database
+# =============================================================================
+
+def tune_import_connection(conn):
+    """
+    Apply bulk-import PRAGMAs to a connection.
+
+    WAL with synchronous = NORMAL matches server.py's settings and turns each
+    commit into a WAL append without a full sync; the larger page cache and
+    in-memory temp store keep the import's working set off disk, and reads
+    of existing pages go through a memory map. WAL relies on shared memory
+    between connections, so the database must be on a local filesystem,
+    not a network mount such as NFS.
+    """
+    conn.execute("PRAGMA busy_timeout = 5000")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -65536")  # 64 MiB
+    conn.execute("PRAGMA mmap_size = 268435456")  # 256 MiB
+    conn.execute("PRAGMA foreign_keys = ON")
+
+
+def execute_batch(cursor, sql: str, rows: list[tuple], labels: list[str]) -> int:
+    """
+    Run one prepared statement over all rows with executemany.
+
+    If the batch fails it is rolled back to a savepoint and retried row by
+    row, so a bad record only costs itself. Returns the number of failed rows.
+    """
+    if not rows:
+        return 0
+
+    cursor.execute("SAVEPOINT batch")
+    try:
+        cursor.executemany(sql, rows)
+        cursor.execute("RELEASE batch")
+        return 0
+    except sqlite3.Error as e:
+        cursor.execute("ROLLBACK TO batch")
+        cursor.execute("RELEASE batch")
+        logger.warning(f"Batch write failed ({e}), retrying row by row")
+
+    failed = 0
+    for row, label in zip(rows, labels):
+        try:
+            cursor.execute(sql, row)
+        except sqlite3.Error as e:
+            failed += 1
+            logger.error(f"Error importing {label}: {e}")
+    return failed
+
+
+def last_manuscript_id(cursor) -> int:
+    """Highest manuscript ID so far; AUTOINCREMENT IDs above it are new rows."""
+    return cursor.execute(
+        "SELECT COALESCE(MAX(id), 0) FROM manuscripts"
+    ).fetchone()[0]
+
+
+def load_manuscript_ids(cursor, repo_id: Optional[int]) -> dict[str, int]:
+    """Map shelfmark -> manuscript ID for every manuscript of a repository, in one query."""
+    if repo_id is None:
+        return {}
+    return dict(cursor.execute(
+        "SELECT shelfmark, id FROM manuscripts WHERE repository_id = ?",
+        (repo_id,),
+    ))
+
+
+def write_records(
+    cursor,
+    records: list[dict],
+    repo_id: int,
+    existing: dict[str, int],
+    insert_sql: str,
+    update_sql: str,
+    fields,
+) -> tuple[int, int, int]:
+    """
+    Insert new records and update known ones with one executemany each.
+
+    fields(record) returns the column values the two statements share, in
+    statement order: insert_sql takes (repository_id, shelfmark, *fields)
+    and update_sql takes (*fields, id). existing maps shelfmark -> ID (from
+    load_manuscript_ids) and is kept current with the rows inserted here,
+    so later batches update them. A shelfmark listed twice in one batch is
+    written once with its last record, the earlier one counting as an
+    update. Returns (inserted, updated, failed).
+    """
+    new_records = {}
+    update_rows, update_labels = [], []
+    duplicates = 0
+    for record in records:
+        shelfmark = record["shelfmark"]
+        existing_id = existing.get(shelfmark)
+        if existing_id:
+            update_rows.append((*fields(record), existing_id))
+            update_labels.append(shelfmark)
+        else:
+            if shelfmark in new_records:
+                duplicates += 1
+            new_records[shelfmark] = record
+
+    since_id = last_manuscript_id(cursor)
+    insert_failed = execute_batch(
+        cursor,
+        insert_sql,
+        [(repo_id, sm, *fields(r)) for sm, r in new_records.items()],
+        list(new_records),
+    )
+    if new_records:
+        existing.update(cursor.execute(
+            "SELECT shelfmark, id FROM manuscripts WHERE repository_id = ? AND id > ?",
+            (repo_id, since_id),
+        ))
+    update_failed = execute_batch(cursor, update_sql, update_rows, update_labels)
+
+    inserted = len(new_records) - insert_failed
+    updated = len(update_rows) - update_failed + duplicates
+    return inserted, updated, insert_failed + update_failed
+
+
+SHELFMARK_LOOKUP_SQL = (
+    "SELECT id FROM manuscripts WHERE shelfmark = ? AND repository_id = ?"
+)
+
+
+def _has_shelfmark_index(cursor) -> bool:
+    """Whether some unique index covers exactly (repository_id, shelfmark)."""
+    for _, name, unique, *_ in cursor.execute(
+        "PRAGMA index_list(manuscripts)"
+    ).fetchall():
+        if not unique:
+            continue
+        columns = {
+            row[2] for row in cursor.execute(f"PRAGMA index_info('{name}')")
+        }
+        if columns == {"repository_id", "shelfmark"}:
+            return True
+    return False
+
+
+def ensure_shelfmark_index(cursor):
+    """
+    Make sure (repository_id, shelfmark) lookups use a unique B-tree index.
+
+    schema.sql declares UNIQUE(repository_id, shelfmark), which SQLite backs
+    with an automatic index; databases created without it get an explicit one.
+    """
+    if _has_shelfmark_index(cursor):
+        return
+    try:
+        cursor.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_manuscripts_repo_shelfmark "
+            "ON manuscripts(repository_id, shelfmark)"
+        )
+    except sqlite3.IntegrityError as e:
+        logger.warning(f"Could not add shelfmark index (duplicate rows?): {e}")
+
+
+def log_shelfmark_query_plan(cursor):
+    """Log the shelfmark lookup plan and warn if it is not an index search."""
+    plan = cursor.execute(
+        f"EXPLAIN QUERY PLAN {SHELFMARK_LOOKUP_SQL}", ("", 0)
+    ).fetchall()
+    details = [row[-1] for row in plan]
+    for detail in details:
+        logger.info(f"Query plan: {detail}")
+    if not any(d.startswith("SEARCH") and "INDEX" in d for d in details):
+        logger.warning("Shelfmark lookup is not using an index: "
+                       + "; ".join(details))
@@ -268,6 +268,7 @@ def mark_failed(progress: dict, item_id: int, progress_path: Path):
 
 def extract_metadata_value(metadata: list[dict], label: str) -> Optional[str]:
     """Extract a value from the IIIF metadata array by label."""
+    label_norm = label.lower().strip()
     for entry in metadata:
         entry_label = entry.get("label", "")
         # Handle both string and dict labels
@@ -286,7 +287,7 @@ def extract_metadata_value(metadata: list[dict], label: str) -> Optional[str]:
         if not isinstance(entry_label, str):
             continue
 
-        if entry_label.lower().strip() == label.lower().strip():
+        if entry_label.lower().strip() == label_norm:
             value = entry.get("value", "")
             if isinstance(value, list):
                 # Join multiple values
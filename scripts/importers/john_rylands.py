@@ -388,6 +388,7 @@ def mark_failed(progress: dict, ms_id: str, progress_path: Path):
 
 def extract_metadata_value(metadata: list[dict], label: str) -> Optional[str]:
     """Extract a value from the IIIF metadata array by label."""
+    label_norm = label.lower().strip()
     for entry in metadata:
         entry_label = entry.get("label", "")
 
@@ -406,7 +407,7 @@ def extract_metadata_value(metadata: list[dict], label: str) -> Optional[str]:
         if not isinstance(entry_label, str):
             continue
 
-        if entry_label.lower().strip() == label.lower().strip():
+        if entry_label.lower().strip() == label_norm:
             value = entry.get("value", "")
             if isinstance(value, list):
                 parts = []
@@ -15,20 +15,33 @@ Usage:
     python scripts/importers/lambeth.py                    # Dry-run mode
     python scripts/importers/lambeth.py --execute          # Actually import
     python scripts/importers/lambeth.py --verbose          # Detailed logging
+    python scripts/importers/lambeth.py --limit 5          # First 5 manifests only
+    python scripts/importers/lambeth.py --refresh          # Revalidate cached manifests
+    python scripts/importers/lambeth.py --no-cache         # Bypass the manifest cache
 """
 
 import argparse
+import io
 import json
 import logging
 import re
 import sqlite3
 import sys
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Optional
-from urllib.request import Request, urlopen
 from urllib.error import HTTPError, URLError
 
+from _iiif_utils import (
+    RateLimiter,
+    ensure_shelfmark_index,
+    fetch_json_cached,
+    http_get,
+    index_metadata,
+    log_shelfmark_query_plan,
+    metadata_value,
+)
+
 # Project paths
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 DB_PATH = PROJECT_ROOT / "database" / "compilatio.db"
@@ -37,8 +50,9 @@ DB_PATH = PROJECT_ROOT / "database" / "compilatio.db"
 COLLECTION_URL = "https://cudl.lib.cam.ac.uk/iiif/collection/scriptorium"
 VIEWER_BASE = "https://cudl.lib.cam.ac.uk/view"
 
-# Rate limiting
-REQUEST_DELAY = 0.5
+# Rate limiting: manifests are fetched in parallel, capped at ~20 requests/s
+REQUEST_DELAY = 0.05
+MAX_WORKERS = 16
 
 # Setup logging
 logging.basicConfig(
@@ -53,9 +67,8 @@ USER_AGENT = "Compilatio/1.0 (Academic manuscript research; IIIF aggregator)"
 def fetch_json(url: str) -> Optional[dict]:
     """Fetch a URL and parse as JSON."""
     try:
-        req = Request(url, headers={"User-Agent": USER_AGENT})
-        with urlopen(req, timeout=30) as resp:
-            return json.loads(resp.read().decode("utf-8"))
+        with http_get(url, {"User-Agent": USER_AGENT}) as resp:
+            return json.loads(resp.read())
     except (HTTPError, URLError, json.JSONDecodeError) as e:
         logger.warning(f"Failed to fetch {url}: {e}")
         return None
@@ -84,24 +97,6 @@ def fetch_lambeth_manifests() -> list[dict]:
     return manifests
 
 
-def extract_metadata_value(metadata: list[dict], label: str) -> Optional[str]:
-    """Extract a value from the IIIF metadata array by label."""
-    for entry in metadata:
-        entry_label = entry.get("label", "")
-        if isinstance(entry_label, dict):
-            entry_label = entry_label.get("@value", "")
-        if entry_label == label:
-            value = entry.get("value", "")
-            if isinstance(value, list):
-                value = "; ".join(str(v) for v in value)
-            if isinstance(value, dict):
-                value = value.get("@value", str(value))
-            value = re.sub(r'<[^>]+>', ' ', str(value))
-            value = re.sub(r'\s+', ' ', value).strip()
-            return value if value else None
-    return None
-
-
 def extract_thumbnail_url(manifest: dict) -> Optional[str]:
     """Extract thumbnail URL from first canvas image service."""
     sequences = manifest.get("sequences", [])
@@ -120,10 +115,10 @@ def extract_thumbnail_url(manifest: dict) -> Optional[str]:
 
 def parse_manifest(manifest_data: dict, manifest_url: str) -> Optional[dict]:
     """Parse a CUDL manifest into a Compilatio record for Lambeth."""
-    metadata = manifest_data.get("metadata", [])
+    fields = index_metadata(manifest_data.get("metadata", []))
 
     # Extract classmark
-    classmark = extract_metadata_value(metadata, "Classmark")
+    classmark = metadata_value(fields, "Classmark")
     if not classmark:
         return None
 
@@ -141,12 +136,12 @@ def parse_manifest(manifest_data: dict, manifest_url: str) -> Optional[dict]:
     }
 
     # Title
-    title = extract_metadata_value(metadata, "Title")
+    title = metadata_value(fields, "Title")
     if title:
         record["contents"] = title[:1000] if len(title) > 1000 else title
 
     # Date
-    date_str = extract_metadata_value(metadata, "Date of Creation")
+    date_str = metadata_value(fields, "Date of Creation")
     if date_str:
         record["date_display"] = date_str
         years = re.findall(r'\b(\d{4})\b', date_str)
@@ -158,20 +153,20 @@ def parse_manifest(manifest_data: dict, manifest_url: str) -> Optional[dict]:
             record["date_end"] = int(years[0])
 
     # Language
-    language = extract_metadata_value(metadata, "Language(s)")
+    language = metadata_value(fields, "Language(s)")
     if language:
         record["language"] = language
 
     # Provenance
-    provenance = extract_metadata_value(metadata, "Provenance")
-    origin = extract_metadata_value(metadata, "Origin Place")
+    provenance = metadata_value(fields, "Provenance")
+    origin = metadata_value(fields, "Origin Place")
     if provenance:
         record["provenance"] = provenance
     elif origin:
         record["provenance"] = origin
 
     # Extent
-    extent = extract_metadata_value(metadata, "Extent")
+    extent = metadata_value(fields, "Extent")
     if extent:
         record["folios"] = extent
 
@@ -207,10 +202,30 @@ def ensure_repository(cursor) -> int:
     return cursor.lastrowid
 
 
+def load_existing_shelfmarks(cursor, repo_id: Optional[int]) -> dict[str, int]:
+    """
+    Map shelfmark -> manuscript ID for manuscripts already in the database.
+
+    One query up front replaces a SELECT per record. Without a repo_id
+    (dry run) every repository is considered, as the dry-run check was.
+    """
+    if repo_id is None:
+        cursor.execute("SELECT shelfmark, id FROM manuscripts")
+    else:
+        cursor.execute(
+            "SELECT shelfmark, id FROM manuscripts WHERE repository_id = ?",
+            (repo_id,)
+        )
+    return dict(cursor.fetchall())
+
+
 def import_lambeth(
     db_path: Path,
     dry_run: bool = True,
     verbose: bool = False,
+    limit: int = None,
+    use_cache: bool = True,
+    refresh: bool = False,
 ):
     """Import Lambeth manuscripts from CUDL Scriptorium collection."""
     if verbose:
@@ -226,15 +241,32 @@ def import_lambeth(
         logger.warning("No Lambeth manuscripts found in CUDL")
         return True
 
-    # Step 2: Fetch and parse each manifest
+    if limit:
+        stubs = stubs[:limit]
+        logger.info(f"Limiting to {len(stubs)} manifests")
+
+    # Step 2: Fetch manifests in parallel, then parse in collection order
+    manifest_urls = [stub["@id"].replace("http://", "https://") for stub in stubs]
+    limiter = RateLimiter(REQUEST_DELAY)
+    manifests = [None] * len(manifest_urls)
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(
+                fetch_json_cached, url, USER_AGENT,
+                use_cache=use_cache, refresh=refresh, limiter=limiter,
+            ): i
+            for i, url in enumerate(manifest_urls)
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            manifests[i] = future.result()
+            logger.info(f"[{done}/{len(manifest_urls)}] Fetched {manifest_urls[i]}")
+
     records = []
     errors = 0
 
-    for i, stub in enumerate(stubs):
-        manifest_url = stub["@id"].replace("http://", "https://")
-        logger.info(f"[{i+1}/{len(stubs)}] Fetching {manifest_url}")
-
-        manifest_data = fetch_json(manifest_url)
+    for manifest_url, manifest_data in zip(manifest_urls, manifests):
         if not manifest_data:
             errors += 1
             continue
@@ -246,35 +278,31 @@ def import_lambeth(
         else:
             errors += 1
 
-        if i < len(stubs) - 1:
-            time.sleep(REQUEST_DELAY)
-
     # Step 3: Database operations
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
     repo_id = ensure_repository(cursor) if not dry_run else 1
+    if not dry_run:
+        ensure_shelfmark_index(cursor)
+    if verbose:
+        log_shelfmark_query_plan(cursor)
+    existing = load_existing_shelfmarks(cursor, None if dry_run else repo_id)
 
     stats = {"inserted": 0, "updated": 0, "errors": 0}
 
     for record in records:
         shelfmark = record["shelfmark"]
+        existing_id = existing.get(shelfmark)
 
         if dry_run:
-            cursor.execute("SELECT id FROM manuscripts WHERE shelfmark = ?", (shelfmark,))
-            if cursor.fetchone():
+            if existing_id:
                 stats["updated"] += 1
             else:
                 stats["inserted"] += 1
         else:
             try:
-                cursor.execute(
-                    "SELECT id FROM manuscripts WHERE shelfmark = ? AND repository_id = ?",
-                    (shelfmark, repo_id)
-                )
-                existing = cursor.fetchone()
-
-                if existing:
+                if existing_id:
                     cursor.execute("""
                         UPDATE manuscripts SET
                             collection = ?, date_display = ?, date_start = ?,
@@ -288,7 +316,7 @@ def import_lambeth(
                         record.get("contents"), record.get("provenance"),
                         record.get("language"), record.get("folios"),
                         record["iiif_manifest_url"], record.get("thumbnail_url"),
-                        record.get("source_url"), existing[0],
+                        record.get("source_url"), existing_id,
                     ))
                     stats["updated"] += 1
                 else:
@@ -306,6 +334,7 @@ def import_lambeth(
                         record.get("folios"), record["iiif_manifest_url"],
                         record.get("thumbnail_url"), record.get("source_url"),
                     ))
+                    existing[shelfmark] = cursor.lastrowid
                     stats["inserted"] += 1
             except Exception as e:
                 stats["errors"] += 1
@@ -315,29 +344,32 @@ def import_lambeth(
         conn.commit()
     conn.close()
 
-    # Summary
-    print("\n" + "=" * 70)
-    print(f"{'DRY RUN - ' if dry_run else ''}LAMBETH PALACE LIBRARY IMPORT SUMMARY")
-    print("=" * 70)
-    print(f"\n  Manifests fetched:  {len(stubs)}")
-    print(f"  Records parsed:     {len(records)}")
-    print(f"  Fetch errors:       {errors}")
-    print(f"\n  {'Would insert' if dry_run else 'Inserted'}:  {stats['inserted']}")
-    print(f"  {'Would update' if dry_run else 'Updated'}:   {stats['updated']}")
-    print(f"  DB errors:          {stats['errors']}")
+    # Summary (buffered and written to stdout in one go)
+    buf = io.StringIO()
+    print("\n" + "=" * 70, file=buf)
+    print(f"{'DRY RUN - ' if dry_run else ''}LAMBETH PALACE LIBRARY IMPORT SUMMARY", file=buf)
+    print("=" * 70, file=buf)
+    print(f"\n  Manifests fetched:  {len(stubs)}", file=buf)
+    print(f"  Records parsed:     {len(records)}", file=buf)
+    print(f"  Fetch errors:       {errors}", file=buf)
+    print(f"\n  {'Would insert' if dry_run else 'Inserted'}:  {stats['inserted']}", file=buf)
+    print(f"  {'Would update' if dry_run else 'Updated'}:   {stats['updated']}", file=buf)
+    print(f"  DB errors:          {stats['errors']}", file=buf)
 
     for rec in records:
-        print(f"\n  {rec['shelfmark']}")
+        print(f"\n  {rec['shelfmark']}", file=buf)
         if rec.get("contents"):
-            print(f"    {rec['contents'][:80]}")
+            print(f"    {rec['contents'][:80]}", file=buf)
         if rec.get("date_display"):
-            print(f"    Date: {rec['date_display']}")
+            print(f"    Date: {rec['date_display']}", file=buf)
 
     if dry_run:
-        print("\n" + "=" * 70)
-        print("This was a DRY RUN. No changes were made to the database.")
-        print("Run with --execute to apply changes.")
-        print("=" * 70)
+        print("\n" + "=" * 70, file=buf)
+        print("This was a DRY RUN. No changes were made to the database.", file=buf)
+        print("Run with --execute to apply changes.", file=buf)
+        print("=" * 70, file=buf)
+
+    sys.stdout.write(buf.getvalue())
 
     return True
 
@@ -352,6 +384,12 @@ def main():
                         help='Show detailed logging')
     parser.add_argument('--db', type=Path, default=DB_PATH,
                         help=f'Path to database (default: {DB_PATH})')
+    parser.add_argument('--limit', type=int, default=None,
+                        help='Limit number of manifests to fetch')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Bypass the on-disk manifest cache')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Revalidate cached manifests with the server')
 
     args = parser.parse_args()
 
@@ -359,10 +397,13 @@ def main():
     print(f"Source: CUDL Scriptorium (Lambeth subset)")
     print(f"DB:   {args.db}")
     print(f"Mode: {'EXECUTE' if args.execute else 'DRY-RUN'}")
+    if args.limit:
+        print(f"Limit: {args.limit}")
     print()
 
     success = import_lambeth(
         db_path=args.db, dry_run=not args.execute, verbose=args.verbose,
+        limit=args.limit, use_cache=not args.no_cache, refresh=args.refresh,
     )
     sys.exit(0 if success else 1)
 
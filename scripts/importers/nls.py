@@ -6,6 +6,8 @@ Imports digitized medieval manuscripts from the NLS IIIF collections.
 Crawls three manuscript collections from the NLS IIIF endpoint.
 
 No browser needed — pure HTTP/JSON (IIIF Presentation API 2.0).
+Manifests are fetched concurrently when aiohttp is installed
+(pip install aiohttp), otherwise one at a time with urllib.
 
 Source collections:
     Early Scottish manuscripts:     https://view.nls.uk/collections/1875/4854/187548545.json
@@ -17,9 +19,12 @@ Usage:
     python scripts/importers/nls.py --execute          # Actually import
     python scripts/importers/nls.py --test             # First 5 only
     python scripts/importers/nls.py --verbose          # Detailed logging
+    python scripts/importers/nls.py --refresh          # Re-import known manuscripts, revalidating cache
+    python scripts/importers/nls.py --no-cache         # Bypass the manifest cache
 """
 
 import argparse
+import asyncio
 import json
 import logging
 import re
@@ -28,9 +33,24 @@ import sys
 import time
 from pathlib import Path
 from typing import Optional
-from urllib.request import Request, urlopen
 from urllib.error import HTTPError, URLError
 
+from _iiif_utils import (
+    ASYNC_HTTP_AVAILABLE,
+    RateLimiter,
+    ensure_shelfmark_index,
+    execute_batch,
+    fetch_manifests_async,
+    http_get,
+    index_metadata,
+    iter_manifests_sync,
+    json_loads,
+    last_manuscript_id,
+    log_shelfmark_query_plan,
+    metadata_value,
+    tune_import_connection,
+)
+
 # Project paths
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 DB_PATH = PROJECT_ROOT / "database" / "compilatio.db"
@@ -57,7 +77,9 @@ COLLECTIONS = {
 VIEWER_BASE = "https://digital.nls.uk"
 
 # Rate limiting
-REQUEST_DELAY = 0.5  # seconds between manifest fetches
+REQUEST_DELAY = 0.5  # seconds between collection fetches
+MANIFEST_INTERVAL = 0.1  # manifest pacing (10 req/s), slower if the server asks
+MAX_CONCURRENCY = 16  # concurrent manifest requests when aiohttp is available
 
 # Setup logging
 logging.basicConfig(
@@ -76,9 +98,8 @@ USER_AGENT = "Compilatio/1.0 (Academic manuscript research; IIIF aggregator)"
 def fetch_json(url: str) -> Optional[dict]:
     """Fetch a URL and parse as JSON."""
     try:
-        req = Request(url, headers={"User-Agent": USER_AGENT})
-        with urlopen(req, timeout=30) as resp:
-            return json.loads(resp.read().decode("utf-8"))
+        with http_get(url, {"User-Agent": USER_AGENT}) as resp:
+            return json_loads(resp.read())
     except (HTTPError, URLError, json.JSONDecodeError) as e:
         logger.warning(f"Failed to fetch {url}: {e}")
         return None
@@ -88,16 +109,22 @@ def fetch_json(url: str) -> Optional[dict]:
 # Collection Fetching
 # =============================================================================
 
-def fetch_all_manifests() -> list[tuple[dict, str]]:
+def fetch_all_manifests(limit: Optional[int] = None) -> list[tuple[dict, str]]:
     """
     Fetch all manifest stubs from NLS collections.
 
+    With a limit, stops as soon as that many unique stubs are collected,
+    so later collections are not fetched at all.
+
     Returns list of (stub, collection_name) tuples.
     """
     all_manifests = []
     seen_ids = set()
 
     for key, config in COLLECTIONS.items():
+        if limit and len(all_manifests) >= limit:
+            break
+
         logger.info(f"Fetching collection: {config['label']}")
         data = fetch_json(config["url"])
 
@@ -116,6 +143,8 @@ def fetch_all_manifests() -> list[tuple[dict, str]]:
                     {"@id": mid, "label": m.get("label", "")},
                     config["collection_name"]
                 ))
+                if limit and len(all_manifests) >= limit:
+                    break
 
         time.sleep(REQUEST_DELAY)
 
@@ -126,45 +155,16 @@ def fetch_all_manifests() -> list[tuple[dict, str]]:
 # Manifest Parsing
 # =============================================================================
 
-def extract_metadata_value(metadata: list[dict], label: str) -> Optional[str]:
-    """Extract a value from the IIIF metadata array by label."""
-    for entry in metadata:
-        entry_label = entry.get("label", "")
-        if isinstance(entry_label, dict):
-            entry_label = entry_label.get("@value", "")
-        if isinstance(entry_label, list):
-            entry_label = entry_label[0] if entry_label else ""
-            if isinstance(entry_label, dict):
-                entry_label = entry_label.get("@value", "")
-
-        if entry_label.lower().strip() == label.lower().strip():
-            value = entry.get("value", "")
-            if isinstance(value, list):
-                # Handle multi-language values
-                for v in value:
-                    if isinstance(v, dict):
-                        return v.get("@value", str(v))
-                value = "; ".join(str(v) for v in value)
-            if isinstance(value, dict):
-                value = value.get("@value", str(value))
-            # Strip HTML tags
-            value = re.sub(r'<[^>]+>', ' ', str(value))
-            value = re.sub(r'\s+', ' ', value).strip()
-            return value if value else None
-    return None
-
-
-def extract_shelfmark(manifest_data: dict) -> Optional[str]:
+def extract_shelfmark(manifest_data: dict, fields: dict[str, str]) -> Optional[str]:
     """
     Extract shelfmark from NLS manifest.
 
-    Tries metadata fields first, then falls back to label parsing.
+    Tries metadata fields (an index_metadata() dict) first, then falls back
+    to label parsing.
     """
-    metadata = manifest_data.get("metadata", [])
-
     # Try metadata fields
     for field in ["Shelfmark", "Shelf Mark", "Reference", "Classmark"]:
-        value = extract_metadata_value(metadata, field)
+        value = metadata_value(fields, field)
         if value:
             return value
 
@@ -236,9 +236,9 @@ def extract_thumbnail_url(manifest: dict) -> Optional[str]:
 def parse_manifest(manifest_data: dict, manifest_url: str,
                    default_collection: str) -> Optional[dict]:
     """Parse an NLS IIIF manifest into a Compilatio record."""
-    metadata = manifest_data.get("metadata", [])
+    fields = index_metadata(manifest_data.get("metadata", []))
 
-    shelfmark = extract_shelfmark(manifest_data)
+    shelfmark = extract_shelfmark(manifest_data, fields)
     if not shelfmark:
         return None
 
@@ -253,7 +253,7 @@ def parse_manifest(manifest_data: dict, manifest_url: str,
     description = manifest_data.get("description", "")
 
     # Try metadata Title field first
-    title = extract_metadata_value(metadata, "Title")
+    title = metadata_value(fields, "Title")
     if title:
         record["contents"] = title
     elif label:
@@ -268,7 +268,7 @@ def parse_manifest(manifest_data: dict, manifest_url: str,
 
     # Date
     for date_field in ["Date", "Date Range", "Published", "Date of Creation"]:
-        date_str = extract_metadata_value(metadata, date_field)
+        date_str = metadata_value(fields, date_field)
         if date_str:
             record["date_display"] = date_str
 
@@ -293,21 +293,21 @@ def parse_manifest(manifest_data: dict, manifest_url: str,
 
     # Language
     for lang_field in ["Language", "Language(s)", "Text Language"]:
-        language = extract_metadata_value(metadata, lang_field)
+        language = metadata_value(fields, lang_field)
         if language:
             record["language"] = language
             break
 
     # Provenance
     for prov_field in ["Provenance", "Origin", "Origin Place"]:
-        prov = extract_metadata_value(metadata, prov_field)
+        prov = metadata_value(fields, prov_field)
         if prov:
             record["provenance"] = prov
             break
 
     # Extent
     for extent_field in ["Extent", "Folios", "Physical Description"]:
-        extent = extract_metadata_value(metadata, extent_field)
+        extent = metadata_value(fields, extent_field)
         if extent:
             record["folios"] = extent
             break
@@ -347,14 +347,102 @@ def ensure_repository(cursor) -> int:
     return cursor.lastrowid
 
 
-def manuscript_exists(cursor, shelfmark: str, repo_id: int) -> Optional[int]:
-    """Check if manuscript exists. Returns ID if found, None otherwise."""
-    cursor.execute(
-        "SELECT id FROM manuscripts WHERE shelfmark = ? AND repository_id = ?",
-        (shelfmark, repo_id)
+UPSERT_SQL = """
+    INSERT INTO manuscripts (
+        repository_id, shelfmark, collection, date_display,
+        date_start, date_end, contents, provenance, language,
+        folios, iiif_manifest_url, thumbnail_url, source_url
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(repository_id, shelfmark) DO UPDATE SET
+        collection = excluded.collection,
+        date_display = excluded.date_display,
+        date_start = excluded.date_start,
+        date_end = excluded.date_end,
+        contents = excluded.contents,
+        provenance = excluded.provenance,
+        language = excluded.language,
+        folios = excluded.folios,
+        iiif_manifest_url = excluded.iiif_manifest_url,
+        thumbnail_url = excluded.thumbnail_url,
+        source_url = excluded.source_url
+"""
+
+
+def record_values(record: dict, repo_id: int) -> tuple:
+    """UPSERT_SQL parameters for one parsed record, in statement order."""
+    return (
+        repo_id, record["shelfmark"],
+        record.get("collection"), record.get("date_display"),
+        record.get("date_start"), record.get("date_end"),
+        record.get("contents"), record.get("provenance"),
+        record.get("language"), record.get("folios"),
+        record["iiif_manifest_url"], record.get("thumbnail_url"),
+        record.get("source_url"),
     )
-    row = cursor.fetchone()
-    return row[0] if row else None
+
+
+def load_existing_shelfmarks(cursor) -> set[str]:
+    """
+    Shelfmarks already in the database, in any repository.
+
+    Only dry runs need this: a real import lets UPSERT_SQL resolve conflicts.
+    """
+    cursor.execute("SELECT shelfmark FROM manuscripts")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def load_known_manifest_urls(db_path: Path) -> set[str]:
+    """Manifest URLs of NLS manuscripts already imported into the database."""
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.execute("""
+            SELECT m.iiif_manifest_url FROM manuscripts m
+            JOIN repositories r ON r.id = m.repository_id
+            WHERE r.short_name = ? AND m.iiif_manifest_url IS NOT NULL
+        """, ("NLS",))
+        return {row[0] for row in cursor}
+    finally:
+        conn.close()
+
+
+def summarize_inserted(cursor, repo_id: int, since_id: int) -> list[tuple]:
+    """
+    Roll up manuscripts inserted after since_id by collection in SQL.
+
+    Returns (collection, count, first three rows as dicts) per collection,
+    ordered by collection name.
+    """
+    params = (repo_id, since_id)
+    summary = []
+    for collection, count in cursor.execute(
+        "SELECT collection, COUNT(*) FROM manuscripts "
+        "WHERE repository_id = ? AND id > ? "
+        "GROUP BY collection ORDER BY collection",
+        params,
+    ).fetchall():
+        rows = cursor.execute(
+            "SELECT shelfmark, date_display, contents FROM manuscripts "
+            "WHERE repository_id = ? AND id > ? AND collection IS ? "
+            "ORDER BY id LIMIT 3",
+            params + (collection,),
+        ).fetchall()
+        samples = [
+            {"shelfmark": r[0], "date_display": r[1], "contents": r[2]}
+            for r in rows
+        ]
+        summary.append((collection or "Unknown", count, samples))
+    return summary
+
+
+def group_by_collection(records: list[dict]) -> list[tuple]:
+    """Same shape as summarize_inserted, for dry runs (nothing is in the DB)."""
+    by_collection = {}
+    for rec in records:
+        by_collection.setdefault(rec.get("collection", "Unknown"), []).append(rec)
+    return [
+        (col, len(recs), recs[:3])
+        for col, recs in sorted(by_collection.items())
+    ]
 
 
 # =============================================================================
@@ -367,6 +455,8 @@ def import_nls(
     test_mode: bool = False,
     verbose: bool = False,
     limit: int = None,
+    use_cache: bool = True,
+    refresh: bool = False,
 ):
     """Import NLS medieval manuscripts from IIIF collections."""
     if verbose:
@@ -378,32 +468,55 @@ def import_nls(
         logger.info("  sqlite3 database/compilatio.db < database/schema.sql")
         return False
 
-    # Step 1: Fetch collection manifest lists
-    stubs_with_collections = fetch_all_manifests()
-    logger.info(f"Found {len(stubs_with_collections)} unique manifests across all collections")
+    # Step 1: Fetch collection manifest lists (stopping early when limited)
+    if test_mode:
+        limit = 5
+    stubs_with_collections = fetch_all_manifests(limit=limit)
+    if limit:
+        logger.info(f"Limited to {len(stubs_with_collections)} manifests"
+                    f"{' (test mode)' if test_mode else ''}")
+    else:
+        logger.info(f"Found {len(stubs_with_collections)} unique manifests across all collections")
 
     if not stubs_with_collections:
         logger.error("No manifests found")
         return False
 
-    # Apply limits
-    if test_mode:
-        stubs_with_collections = stubs_with_collections[:5]
-        logger.info(f"Test mode: limiting to {len(stubs_with_collections)} manifests")
-    elif limit:
-        stubs_with_collections = stubs_with_collections[:limit]
-        logger.info(f"Limiting to {limit} manifests")
+    # Skip manuscripts already imported unless asked to refresh them
+    skipped = 0
+    if not refresh:
+        known = load_known_manifest_urls(db_path)
+        if known:
+            total = len(stubs_with_collections)
+            stubs_with_collections = [
+                (stub, collection) for stub, collection in stubs_with_collections
+                if stub["@id"] not in known
+            ]
+            skipped = total - len(stubs_with_collections)
+            logger.info(f"Skipping {skipped} manifests already in the database "
+                        f"(use --refresh to re-import them)")
+
+    # Step 2: Fetch and parse manifests (parsing overlaps fetching)
+    manifest_urls = [stub["@id"] for stub, _ in stubs_with_collections]
+    logger.info(f"Fetching {len(manifest_urls)} manifests")
+    if ASYNC_HTTP_AVAILABLE:
+        manifests = asyncio.run(fetch_manifests_async(
+            manifest_urls, USER_AGENT,
+            max_concurrency=MAX_CONCURRENCY, rate=1 / MANIFEST_INTERVAL,
+            use_cache=use_cache, refresh=refresh,
+        ))
+    else:
+        manifests = iter_manifests_sync(
+            manifest_urls, USER_AGENT, RateLimiter(MANIFEST_INTERVAL),
+            use_cache=use_cache, refresh=refresh,
+        )
 
-    # Step 2: Fetch and parse each manifest
     records = []
     errors = 0
 
-    for i, (stub, collection_name) in enumerate(stubs_with_collections):
-        manifest_url = stub["@id"]
-
-        logger.info(f"[{i+1}/{len(stubs_with_collections)}] Fetching {stub.get('label', manifest_url)}")
-
-        manifest_data = fetch_json(manifest_url)
+    for (stub, collection_name), manifest_url, manifest_data in zip(
+        stubs_with_collections, manifest_urls, manifests
+    ):
         if not manifest_data:
             errors += 1
             continue
@@ -413,27 +526,20 @@ def import_nls(
             records.append(record)
             logger.debug(f"  -> {record['shelfmark']} [{record['collection']}]")
         else:
-            logger.warning(f"  -> Could not parse manifest")
+            logger.warning(f"  -> Could not parse manifest {stub.get('label', manifest_url)}")
             errors += 1
 
-        if i < len(stubs_with_collections) - 1:
-            time.sleep(REQUEST_DELAY)
-
-        if (i + 1) % 25 == 0:
-            logger.info(f"Progress: {i+1}/{len(stubs_with_collections)} manifests fetched, {len(records)} parsed")
-
     logger.info(f"Fetched {len(stubs_with_collections)} manifests, parsed {len(records)} records, {errors} errors")
 
-    # Step 3: Database operations
-    conn = sqlite3.connect(db_path)
+    # Step 3: Database operations, in one write transaction when executing
+    conn = sqlite3.connect(db_path, isolation_level=None)
     cursor = conn.cursor()
 
-    repo_id = ensure_repository(cursor) if not dry_run else 1
-
     stats = {
         "manifests_fetched": len(stubs_with_collections),
         "records_parsed": len(records),
         "fetch_errors": errors,
+        "skipped_known": skipped,
         "inserted": 0,
         "updated": 0,
         "db_errors": 0,
@@ -441,61 +547,44 @@ def import_nls(
 
     results = {"inserted": [], "updated": []}
 
-    for record in records:
-        shelfmark = record["shelfmark"]
+    if not dry_run:
+        tune_import_connection(conn)
+        cursor.execute("BEGIN IMMEDIATE")
+
+    try:
+        repo_id = ensure_repository(cursor) if not dry_run else 1
+        if not dry_run:
+            ensure_shelfmark_index(cursor)
+        if verbose:
+            log_shelfmark_query_plan(cursor)
 
         if dry_run:
-            cursor.execute(
-                "SELECT id FROM manuscripts WHERE shelfmark = ?",
-                (shelfmark,)
-            )
-            if cursor.fetchone():
-                stats["updated"] += 1
-                results["updated"].append(record)
-            else:
-                stats["inserted"] += 1
-                results["inserted"].append(record)
-        else:
-            try:
-                existing_id = manuscript_exists(cursor, shelfmark, repo_id)
-
-                if existing_id:
-                    cursor.execute("""
-                        UPDATE manuscripts SET
-                            collection = ?, date_display = ?, date_start = ?,
-                            date_end = ?, contents = ?, provenance = ?,
-                            language = ?, folios = ?, iiif_manifest_url = ?,
-                            thumbnail_url = ?, source_url = ?
-                        WHERE id = ?
-                    """, (
-                        record.get("collection"), record.get("date_display"),
-                        record.get("date_start"), record.get("date_end"),
-                        record.get("contents"), record.get("provenance"),
-                        record.get("language"), record.get("folios"),
-                        record["iiif_manifest_url"], record.get("thumbnail_url"),
-                        record.get("source_url"), existing_id,
-                    ))
+            existing = load_existing_shelfmarks(cursor)
+            for record in records:
+                if record["shelfmark"] in existing:
                     stats["updated"] += 1
+                    results["updated"].append(record)
                 else:
-                    cursor.execute("""
-                        INSERT INTO manuscripts (
-                            repository_id, shelfmark, collection, date_display,
-                            date_start, date_end, contents, provenance, language,
-                            folios, iiif_manifest_url, thumbnail_url, source_url
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        repo_id, shelfmark, record.get("collection"),
-                        record.get("date_display"), record.get("date_start"),
-                        record.get("date_end"), record.get("contents"),
-                        record.get("provenance"), record.get("language"),
-                        record.get("folios"), record["iiif_manifest_url"],
-                        record.get("thumbnail_url"), record.get("source_url"),
-                    ))
                     stats["inserted"] += 1
-
-            except Exception as e:
-                stats["db_errors"] += 1
-                logger.error(f"Error importing {shelfmark}: {e}")
+                    results["inserted"].append(record)
+            inserted_summary = group_by_collection(results["inserted"])
+        else:
+            since_id = last_manuscript_id(cursor)
+            rows = [record_values(record, repo_id) for record in records]
+            failed = execute_batch(
+                cursor, UPSERT_SQL, rows, [r["shelfmark"] for r in records],
+            )
+            # Rows past the ID watermark are new; every other success was
+            # an update (including a shelfmark listed twice in this run)
+            inserted_summary = summarize_inserted(cursor, repo_id, since_id)
+            stats["inserted"] = sum(count for _, count, _ in inserted_summary)
+            stats["updated"] = len(rows) - failed - stats["inserted"]
+            stats["db_errors"] += failed
+    except BaseException:
+        if not dry_run:
+            conn.rollback()
+        conn.close()
+        raise
 
     if not dry_run:
         conn.commit()
@@ -509,30 +598,26 @@ def import_nls(
     print(f"  Manifests fetched:    {stats['manifests_fetched']}")
     print(f"  Records parsed:       {stats['records_parsed']}")
     print(f"  Fetch errors:         {stats['fetch_errors']}")
+    print(f"  Already imported:     {stats['skipped_known']}")
     print(f"\nDatabase Operations {'(would be)' if dry_run else ''}:")
     print(f"  {'Would insert' if dry_run else 'Inserted'}:  {stats['inserted']}")
     print(f"  {'Would update' if dry_run else 'Updated'}:   {stats['updated']}")
     print(f"  Errors:               {stats['db_errors']}")
 
-    if results.get("inserted"):
+    if inserted_summary:
         print("\n" + "-" * 70)
-        print(f"RECORDS TO {'INSERT' if dry_run else 'INSERTED'} (sample):")
+        print(f"RECORDS {'TO INSERT' if dry_run else 'INSERTED'} (sample):")
         print("-" * 70)
-        by_collection = {}
-        for rec in results["inserted"]:
-            col = rec.get("collection", "Unknown")
-            by_collection.setdefault(col, []).append(rec)
-        for col in sorted(by_collection.keys()):
-            recs = by_collection[col]
-            print(f"\n  {col} ({len(recs)}):")
-            for rec in recs[:3]:
+        for col, count, samples in inserted_summary:
+            print(f"\n  {col} ({count}):")
+            for rec in samples:
                 date = f" ({rec.get('date_display', '')})" if rec.get('date_display') else ""
                 print(f"    {rec['shelfmark']}{date}")
                 if rec.get("contents"):
                     contents = rec["contents"][:60] + "..." if len(rec.get("contents", "")) > 60 else rec.get("contents", "")
                     print(f"      {contents}")
-            if len(recs) > 3:
-                print(f"    ... and {len(recs) - 3} more")
+            if count > 3:
+                print(f"    ... and {count - 3} more")
 
     if dry_run:
         print("\n" + "=" * 70)
@@ -557,6 +642,11 @@ def main():
                         help=f'Path to database (default: {DB_PATH})')
     parser.add_argument('--limit', type=int, default=None,
                         help='Limit number of manifests to fetch')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Bypass the on-disk manifest cache')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Re-import manuscripts already in the database and '
+                             'revalidate cached manifests with the server')
 
     args = parser.parse_args()
 
@@ -571,6 +661,7 @@ def main():
     success = import_nls(
         db_path=args.db, dry_run=not args.execute,
         test_mode=args.test, verbose=args.verbose, limit=args.limit,
+        use_cache=not args.no_cache, refresh=args.refresh,
     )
     sys.exit(0 if success else 1)
 
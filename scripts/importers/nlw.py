@@ -8,13 +8,15 @@ then fetches IIIF manifests from damsssl.llgc.org.uk for metadata.
 
 Two-phase process:
   Phase 1 (Discovery): Crawl archives.library.wales with crawl4ai to find
-    manuscript slugs and handle PIDs. Results cached to JSON.
-  Phase 2 (Import): Fetch IIIF manifests via plain HTTP, parse metadata,
-    and insert into the Compilatio database.
+    manuscript slugs and handle PIDs. Results cached to JSON Lines.
+  Phase 2 (Import): Fetch IIIF manifests via plain HTTP (concurrently over
+    one keep-alive aiohttp session when aiohttp is installed), parse
+    metadata, and insert into the Compilatio database.
 
 Dependencies:
     pip install crawl4ai beautifulsoup4
     crawl4ai-setup
+    pip install lxml    # optional, faster HTML parsing
 
 Source:
     https://archives.library.wales/index.php/informationobject/browse
@@ -27,25 +29,44 @@ Usage:
     python scripts/importers/nlw.py --discover-only    # Only run discovery
     python scripts/importers/nlw.py --test             # First 5 only
     python scripts/importers/nlw.py --verbose          # Detailed logging
+    python scripts/importers/nlw.py --refresh          # Revalidate cached manifests
+    python scripts/importers/nlw.py --no-cache         # Bypass the manifest cache
+    python scripts/importers/nlw.py --execute --fresh  # Ignore an interrupted import's progress
 """
 
 import argparse
 import asyncio
-import json
+import io
 import logging
 import re
 import sqlite3
 import sys
-import time
+from operator import itemgetter
 from pathlib import Path
 from typing import Optional
-from urllib.request import Request, urlopen
-from urllib.error import HTTPError, URLError
+
+from _iiif_utils import (
+    ASYNC_HTTP_AVAILABLE,
+    HTML_PARSER,
+    RateLimiter,
+    ensure_shelfmark_index,
+    execute_batch,
+    index_metadata,
+    iter_manifests_background,
+    iter_manifests_sync,
+    json_dumps,
+    json_loads,
+    last_manuscript_id,
+    metadata_value,
+    tune_import_connection,
+)
 
 # Project paths
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 DB_PATH = PROJECT_ROOT / "database" / "compilatio.db"
-CACHE_PATH = PROJECT_ROOT / "data" / "nlw_peniarth_discovery.json"
+CACHE_PATH = PROJECT_ROOT / "data" / "nlw_peniarth_discovery.jsonl"
+# Single-array cache written before the switch to JSON Lines
+LEGACY_CACHE_PATH = PROJECT_ROOT / "data" / "nlw_peniarth_discovery.json"
 
 # NLW URLs
 ARCHIVES_BASE = "https://archives.library.wales"
@@ -58,8 +79,20 @@ BROWSE_URL = (
 IIIF_BASE = "https://damsssl.llgc.org.uk/iiif/2.0"
 VIEWER_BASE = "https://viewer.library.wales"
 
+# Regex patterns (compiled once; used for every browse row and manifest)
+PENIARTH_PATTERN = re.compile(r"(Peniarth MS \d+[A-Za-z]*(?:\s*\([^)]+\))?)")
+BRACKETED_DATE_PATTERN = re.compile(r"\[([^\]]*\d[^\]]*)\]")
+HANDLE_PID_PATTERN = re.compile(r"10107/(\d+)")
+YEAR_PATTERN = re.compile(r"\b(\d{4})\b")
+CENTURY_PATTERN = re.compile(r"(\d{1,2})\s*(?:st|nd|rd|th)?\s*cent", re.IGNORECASE)
+# Title prefix before any trailing "[shelfmark, date]" block and trailing commas
+TITLE_CLEAN_PATTERN = re.compile(r"^\s*(.*?)[\s,]*(?:\[.*)?$", re.DOTALL)
+
 # Rate limiting
-MANIFEST_DELAY = 0.3  # seconds between IIIF manifest fetches
+MANIFEST_DELAY = 0.3  # seconds between IIIF manifest fetches (on average)
+MAX_CONCURRENCY = 8  # concurrent manifest requests when aiohttp is available
+WRITE_BATCH_SIZE = 50  # records per executemany while manifests are still arriving
+DETAIL_CONCURRENCY = 4  # parallel detail-page loads (archives site is behind Cloudflare)
 
 # Setup logging
 logging.basicConfig(
@@ -76,15 +109,42 @@ USER_AGENT = "Compilatio/1.0 (Academic manuscript research; IIIF aggregator)"
 # =============================================================================
 
 
-def fetch_json(url: str) -> Optional[dict]:
-    """Fetch a URL and parse as JSON."""
-    try:
-        req = Request(url, headers={"User-Agent": USER_AGENT})
-        with urlopen(req, timeout=30) as resp:
-            return json.loads(resp.read().decode("utf-8"))
-    except (HTTPError, URLError, json.JSONDecodeError) as e:
-        logger.warning(f"Failed to fetch {url}: {e}")
-        return None
+def manifest_url_for(item: dict) -> str:
+    """IIIF manifest URL for a discovered item's handle PID."""
+    return f"{IIIF_BASE}/{item['pid']}/manifest.json"
+
+
+def fetch_all_manifests(
+    items: list[dict], use_cache: bool = True, refresh: bool = False,
+):
+    """
+    Fetch the IIIF manifest of every item, yielding (item, url, manifest).
+
+    With aiohttp, up to MAX_CONCURRENCY requests share one keep-alive
+    session on a background thread, paced to one per MANIFEST_DELAY on
+    average, and results arrive in completion order; otherwise falls back
+    to sequential urllib. Both read and fill the on-disk manifest cache
+    unless use_cache is False. manifest is None when a fetch failed.
+    """
+    urls = [manifest_url_for(item) for item in items]
+    logger.info(f"Fetching {len(urls)} IIIF manifests")
+    if ASYNC_HTTP_AVAILABLE:
+        for i, manifest in iter_manifests_background(
+            urls,
+            USER_AGENT,
+            max_concurrency=MAX_CONCURRENCY,
+            rate=1 / MANIFEST_DELAY,
+            use_cache=use_cache,
+            refresh=refresh,
+            decode=json_loads,
+        ):
+            yield items[i], urls[i], manifest
+    else:
+        manifests = iter_manifests_sync(
+            urls, USER_AGENT, RateLimiter(MANIFEST_DELAY),
+            use_cache=use_cache, refresh=refresh, decode=json_loads,
+        )
+        yield from zip(items, urls, manifests)
 
 
 # =============================================================================
@@ -92,13 +152,93 @@ def fetch_json(url: str) -> Optional[dict]:
 # =============================================================================
 
 
+# Detail-page field label prefix -> (item key, max length)
+DETAIL_FIELDS = {
+    "Language": ("language", None),
+    "Scope and content": ("contents", 1000),
+    "Extent": ("extent", None),
+    "Archival history": ("provenance", 1000),
+}
+
+
+def parse_detail_fields(soup, item: dict):
+    """
+    Copy the handle PID and descriptive fields from a detail page into item.
+
+    One pass over the page's .field blocks: each label is read once and
+    dispatched on its prefix; the PID comes from "Existence and location
+    of copies".
+    """
+    for field in soup.select(".field"):
+        label = field.find("h3")
+        if not label:
+            continue
+        label_text = label.get_text(strip=True)
+
+        if label_text.startswith("Existence"):
+            match = HANDLE_PID_PATTERN.search(field.get_text(strip=True))
+            if match:
+                item["pid"] = match.group(1)
+            continue
+
+        for prefix, (key, max_len) in DETAIL_FIELDS.items():
+            if label_text.startswith(prefix):
+                if key not in item:
+                    body_el = field.find(class_="field-body")
+                    if body_el:
+                        text = body_el.get_text(strip=True)
+                        item[key] = text[:max_len] if max_len else text
+                break
+
+
+async def write_discovery_items(queue: asyncio.Queue, path: Path):
+    """
+    Append discovered items to a JSON Lines file as they arrive.
+
+    The only writer of the file; a None on the queue ends it. Each line is
+    flushed, so an interrupted crawl keeps everything found so far.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "ab") as f:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            f.write(json_dumps(item) + b"\n")
+            f.flush()
+
+
+def partial_cache_path(cache_path: Path) -> Path:
+    """Path of the in-progress discovery file for a cache path."""
+    return cache_path.with_name(cache_path.name + ".partial")
+
+
+def progress_path_for(cache_path: Path) -> Path:
+    """Path of the import progress file (one committed PID per line)."""
+    return cache_path.with_name(cache_path.stem + ".progress")
+
+
+def load_completed_pids(progress_path: Path) -> set[str]:
+    """PIDs whose records an earlier run committed to the database."""
+    try:
+        return set(progress_path.read_text().split())
+    except FileNotFoundError:
+        return set()
+
+
 async def discover_manuscripts(
     test_mode: bool = False,
     limit: int = None,
+    partial_path: Optional[Path] = None,
 ) -> list[dict]:
     """
     Crawl archives.library.wales to discover Peniarth manuscripts.
 
+    Detail pages are loaded DETAIL_CONCURRENCY at a time. With partial_path,
+    each item is appended to that JSON Lines file as soon as its detail
+    page is parsed. Items already recorded there with a PID (from an
+    interrupted run) are reused instead of crawled again.
+
     Returns list of dicts with keys: slug, title, shelfmark, date, pid
     """
     from bs4 import BeautifulSoup
@@ -128,7 +268,7 @@ async def discover_manuscripts(
             logger.info(f"  Browse page {page_num}...")
 
             result = await crawler.arun(url=url, config=crawl_config)
-            soup = BeautifulSoup(result.html, "html.parser")
+            soup = BeautifulSoup(result.html, HTML_PARSER)
 
             articles = soup.select("article")
             if not articles:
@@ -150,12 +290,9 @@ async def discover_manuscripts(
                     title = parts[0].strip().rstrip(",")
 
                 # Parse: "Title | Add to clipboard | Shelfmark. | File | [Date] | ..."
-                shelfmark_match = re.search(
-                    r"(Peniarth MS \d+[A-Za-z]*(?:\s*\([^)]+\))?)",
-                    text,
-                )
+                shelfmark_match = PENIARTH_PATTERN.search(text)
                 # Match any bracketed date-like text (centuries, years, ranges)
-                date_match = re.search(r"\[([^\]]*\d[^\]]*)\]", text)
+                date_match = BRACKETED_DATE_PATTERN.search(text)
 
                 item = {
                     "slug": slug,
@@ -196,75 +333,70 @@ async def discover_manuscripts(
         )
         errors = 0
 
-        for i, item in enumerate(all_items):
+        done = {}
+        queue = None
+        if partial_path:
+            if partial_path.exists():
+                for prior in load_discovery_cache(partial_path):
+                    if prior.get("pid"):
+                        done[prior["slug"]] = prior
+                logger.info(f"  Resuming: {len(done)} detail pages already done")
+            queue = asyncio.Queue()
+            writer = asyncio.create_task(
+                write_discovery_items(queue, partial_path)
+            )
+
+        semaphore = asyncio.Semaphore(DETAIL_CONCURRENCY)
+        fetched = 0
+
+        async def fetch_detail(i: int, item: dict):
+            nonlocal errors, fetched
             slug = item["slug"]
             url = (
                 ARCHIVES_BASE + slug if slug.startswith("/") else slug
             )
 
-            logger.info(
-                f"  [{i+1}/{len(all_items)}] {item.get('shelfmark', slug)}"
-            )
+            async with semaphore:
+                logger.info(
+                    f"  [{i+1}/{len(all_items)}] {item.get('shelfmark', slug)}"
+                )
+                try:
+                    result = await crawler.arun(url=url, config=crawl_config)
+                    soup = BeautifulSoup(result.html, HTML_PARSER)
+
+                    parse_detail_fields(soup, item)
 
-            try:
-                result = await crawler.arun(url=url, config=crawl_config)
-                soup = BeautifulSoup(result.html, "html.parser")
-
-                # Extract handle PID from "Existence and location of copies"
-                for field in soup.select(".field"):
-                    label = field.select_one("h3")
-                    if not label:
-                        continue
-                    label_text = label.get_text(strip=True)
-
-                    if "Existence" in label_text:
-                        body = field.get_text(strip=True)
-                        match = re.search(r"10107/(\d+)", body)
-                        if match:
-                            item["pid"] = match.group(1)
-
-                    # Also grab language and extent from detail page
-                    if "Language" in label_text and "language" not in item:
-                        body_el = field.select_one(".field-body")
-                        if body_el:
-                            item["language"] = body_el.get_text(strip=True)
-
-                    if "Scope and content" in label_text and "contents" not in item:
-                        body_el = field.select_one(".field-body")
-                        if body_el:
-                            text = body_el.get_text(strip=True)
-                            item["contents"] = (
-                                text[:1000] if len(text) > 1000 else text
-                            )
-
-                    if "Extent" in label_text and "extent" not in item:
-                        body_el = field.select_one(".field-body")
-                        if body_el:
-                            item["extent"] = body_el.get_text(strip=True)
-
-                    if "Archival history" in label_text and "provenance" not in item:
-                        body_el = field.select_one(".field-body")
-                        if body_el:
-                            text = body_el.get_text(strip=True)
-                            item["provenance"] = (
-                                text[:1000] if len(text) > 1000 else text
-                            )
-
-                if "pid" not in item:
-                    logger.warning(f"    No handle PID found for {slug}")
+                    if "pid" not in item:
+                        logger.warning(f"    No handle PID found for {slug}")
+                        errors += 1
+                    else:
+                        logger.debug(f"    PID: {item['pid']}")
+
+                except Exception as e:
+                    logger.error(f"    Error fetching {slug}: {e}")
                     errors += 1
-                else:
-                    logger.debug(f"    PID: {item['pid']}")
 
-            except Exception as e:
-                logger.error(f"    Error fetching {slug}: {e}")
-                errors += 1
+            if queue is not None:
+                await queue.put(item)
 
-            if (i + 1) % 25 == 0:
+            fetched += 1
+            if fetched % 25 == 0:
                 logger.info(
-                    f"  Progress: {i+1}/{len(all_items)} detail pages fetched"
+                    f"  Progress: {fetched}/{len(all_items)} detail pages fetched"
                 )
 
+        pending = []
+        for i, item in enumerate(all_items):
+            if item["slug"] in done:
+                all_items[i] = done[item["slug"]]
+            else:
+                pending.append(fetch_detail(i, item))
+        await asyncio.gather(*pending)
+
+        if queue is not None:
+            await queue.put(None)
+            await writer
+
         found = sum(1 for item in all_items if "pid" in item)
         logger.info(
             f"Discovery complete: {found}/{len(all_items)} PIDs found, "
@@ -275,19 +407,34 @@ async def discover_manuscripts(
 
 
 def save_discovery_cache(items: list[dict], cache_path: Path):
-    """Save discovery results to JSON cache."""
+    """Save discovery results to a JSON Lines cache, one item per line."""
     cache_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(cache_path, "w") as f:
-        json.dump(items, f, indent=2)
+    with open(cache_path, "wb") as f:
+        for item in items:
+            f.write(json_dumps(item))
+            f.write(b"\n")
     logger.info(f"Saved {len(items)} items to {cache_path}")
 
 
 def load_discovery_cache(cache_path: Path) -> Optional[list[dict]]:
-    """Load discovery results from JSON cache."""
+    """
+    Load discovery results from the cache.
+
+    Reads JSON Lines; a cache written by older versions as a single JSON
+    array is still accepted. If the default cache is missing, the legacy
+    LEGACY_CACHE_PATH is used instead, so an existing discovery run is not
+    repeated.
+    """
     if not cache_path.exists():
-        return None
-    with open(cache_path) as f:
-        items = json.load(f)
+        if cache_path != CACHE_PATH or not LEGACY_CACHE_PATH.exists():
+            return None
+        cache_path = LEGACY_CACHE_PATH
+    with open(cache_path, "rb") as f:
+        data = f.read()
+    if data.lstrip().startswith(b"["):
+        items = json_loads(data)
+    else:
+        items = [json_loads(line) for line in data.splitlines() if line.strip()]
     logger.info(f"Loaded {len(items)} items from cache: {cache_path}")
     return items
 
@@ -297,56 +444,6 @@ def load_discovery_cache(cache_path: Path) -> Optional[list[dict]]:
 # =============================================================================
 
 
-def extract_metadata_value(metadata: list[dict], label: str) -> Optional[str]:
-    """Extract a value from the IIIF metadata array by label.
-
-    NLW manifests use bilingual labels:
-        [{"@value": "Title", "@language": "en"},
-         {"@value": "Teitl", "@language": "cy-GB"}]
-    """
-    for entry in metadata:
-        entry_label = entry.get("label", "")
-
-        # Handle bilingual label arrays
-        if isinstance(entry_label, list):
-            matched = False
-            for lbl in entry_label:
-                if isinstance(lbl, dict):
-                    val = lbl.get("@value", "")
-                    if val.lower().strip() == label.lower().strip():
-                        matched = True
-                        break
-                elif isinstance(lbl, str):
-                    if lbl.lower().strip() == label.lower().strip():
-                        matched = True
-                        break
-            if not matched:
-                continue
-        elif isinstance(entry_label, dict):
-            if entry_label.get("@value", "").lower().strip() != label.lower().strip():
-                continue
-        elif isinstance(entry_label, str):
-            if entry_label.lower().strip() != label.lower().strip():
-                continue
-        else:
-            continue
-
-        value = entry.get("value", "")
-        if isinstance(value, list):
-            for v in value:
-                if isinstance(v, dict):
-                    return v.get("@value", str(v))
-            value = "; ".join(str(v) for v in value)
-        if isinstance(value, dict):
-            value = value.get("@value", str(value))
-        # Strip HTML tags
-        value = re.sub(r"<[^>]+>", " ", str(value))
-        value = re.sub(r"\s+", " ", value).strip()
-        return value if value else None
-
-    return None
-
-
 def extract_thumbnail_url(manifest: dict) -> Optional[str]:
     """Extract thumbnail URL from manifest."""
     # Try manifest-level thumbnail
@@ -376,16 +473,14 @@ def extract_thumbnail_url(manifest: dict) -> Optional[str]:
 def parse_date(date_str: str) -> tuple[Optional[int], Optional[int]]:
     """Parse date string into (start_year, end_year)."""
     # Try explicit years: "1300-1400", "1350"
-    years = re.findall(r"\b(\d{4})\b", date_str)
+    years = YEAR_PATTERN.findall(date_str)
     if len(years) >= 2:
         return int(years[0]), int(years[-1])
     if len(years) == 1:
         return int(years[0]), int(years[0])
 
     # Century patterns: "13 cent.", "mid-14 cent.", "15 cent., second ½"
-    century_matches = re.findall(
-        r"(\d{1,2})\s*(?:st|nd|rd|th)?\s*cent", date_str, re.IGNORECASE
-    )
+    century_matches = CENTURY_PATTERN.findall(date_str)
     if century_matches:
         first = (int(century_matches[0]) - 1) * 100
         last = (int(century_matches[-1]) - 1) * 100 + 99
@@ -400,16 +495,14 @@ def parse_manifest(
     discovery_item: dict,
 ) -> Optional[dict]:
     """Parse an NLW IIIF manifest into a Compilatio record."""
-    metadata = manifest_data.get("metadata", [])
+    fields = index_metadata(manifest_data.get("metadata", []))
 
     # Shelfmark: prefer discovery data, fall back to manifest
     shelfmark = discovery_item.get("shelfmark")
     if not shelfmark:
-        shelfmark_raw = extract_metadata_value(metadata, "Title") or ""
+        shelfmark_raw = metadata_value(fields, "Title") or ""
         # Try to extract "Peniarth MS X" from the title
-        match = re.search(
-            r"(Peniarth MS \d+[A-Za-z]*(?:\s*\([^)]+\))?)", shelfmark_raw
-        )
+        match = PENIARTH_PATTERN.search(shelfmark_raw)
         if match:
             shelfmark = match.group(1)
         else:
@@ -422,14 +515,10 @@ def parse_manifest(
     }
 
     # Title / contents: prefer manifest metadata, fall back to discovery
-    title = extract_metadata_value(metadata, "Title")
+    title = metadata_value(fields, "Title")
     if title:
-        # Remove shelfmark and date from title if present
-        contents = re.sub(
-            r",?\s*\[.*$", "", title
-        ).strip()
-        # Also remove trailing commas
-        contents = contents.rstrip(",").strip()
+        # Remove shelfmark, date and trailing commas from title in one pass
+        contents = TITLE_CLEAN_PATTERN.match(title).group(1)
         if contents:
             record["contents"] = contents
     if "contents" not in record and discovery_item.get("title"):
@@ -439,7 +528,7 @@ def parse_manifest(
         record["contents"] = discovery_item["contents"]
 
     # Date
-    date_str = extract_metadata_value(metadata, "Date")
+    date_str = metadata_value(fields, "Date")
     if not date_str:
         date_str = discovery_item.get("date_text", "")
     if date_str:
@@ -451,7 +540,7 @@ def parse_manifest(
             record["date_end"] = end
 
     # Physical description / extent
-    extent = extract_metadata_value(metadata, "Physical description")
+    extent = metadata_value(fields, "Physical description")
     if not extent:
         extent = discovery_item.get("extent")
     if extent:
@@ -506,14 +595,81 @@ def ensure_repository(cursor) -> int:
     return cursor.lastrowid
 
 
-def manuscript_exists(cursor, shelfmark: str, repo_id: int) -> Optional[int]:
-    """Check if manuscript exists. Returns ID if found, None otherwise."""
-    cursor.execute(
-        "SELECT id FROM manuscripts WHERE shelfmark = ? AND repository_id = ?",
-        (shelfmark, repo_id),
+UPSERT_SQL = """
+    INSERT INTO manuscripts (
+        repository_id, shelfmark, collection, date_display,
+        date_start, date_end, contents, provenance, language,
+        folios, iiif_manifest_url, thumbnail_url, source_url
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(repository_id, shelfmark) DO UPDATE SET
+        collection = excluded.collection,
+        date_display = excluded.date_display,
+        date_start = excluded.date_start,
+        date_end = excluded.date_end,
+        contents = excluded.contents,
+        provenance = excluded.provenance,
+        language = excluded.language,
+        folios = excluded.folios,
+        iiif_manifest_url = excluded.iiif_manifest_url,
+        thumbnail_url = excluded.thumbnail_url,
+        source_url = excluded.source_url
+"""
+
+
+# Record keys in UPSERT_SQL column order (after repository_id)
+RECORD_COLUMNS = (
+    "shelfmark", "collection", "date_display", "date_start", "date_end",
+    "contents", "provenance", "language", "folios", "iiif_manifest_url",
+    "thumbnail_url", "source_url",
+)
+EMPTY_RECORD = dict.fromkeys(RECORD_COLUMNS)
+record_columns = itemgetter(*RECORD_COLUMNS)
+
+
+def record_values(record: dict, repo_id: int) -> tuple:
+    """UPSERT_SQL parameters for one parsed record, in statement order."""
+    return (repo_id, *record_columns({**EMPTY_RECORD, **record}))
+
+
+def write_records(cursor, records: list[dict], repo_id: int) -> int:
+    """UPSERT a batch of parsed records; returns the number that failed."""
+    return execute_batch(
+        cursor,
+        UPSERT_SQL,
+        [record_values(record, repo_id) for record in records],
+        [record["shelfmark"] for record in records],
     )
-    row = cursor.fetchone()
-    return row[0] if row else None
+
+
+def commit_batch(conn, records: list[dict], repo_id: int, progress) -> int:
+    """
+    UPSERT a batch, commit it, and append its PIDs to the progress file.
+
+    Each batch is its own short transaction, so an interrupted import
+    keeps what it has written and the write lock is not held while
+    manifests download. A batch with failed rows is not recorded as done,
+    so a resumed run retries it. Returns the number of failed rows.
+    """
+    if not records:
+        return 0
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    failed = write_records(cursor, records, repo_id)
+    conn.commit()
+    if not failed:
+        progress.write("".join(f"{record['pid']}\n" for record in records))
+        progress.flush()
+    return failed
+
+
+def load_existing_shelfmarks(cursor) -> set[str]:
+    """
+    Shelfmarks already in the database, in any repository.
+
+    Only dry runs need this: a real import lets UPSERT_SQL resolve conflicts.
+    """
+    cursor.execute("SELECT shelfmark FROM manuscripts")
+    return {row[0] for row in cursor.fetchall()}
 
 
 # =============================================================================
@@ -530,8 +686,18 @@ def import_nlw(
     limit: int = None,
     discover_only: bool = False,
     skip_discovery: bool = False,
+    use_cache: bool = True,
+    refresh: bool = False,
+    resume: bool = True,
 ):
-    """Import NLW Peniarth manuscripts."""
+    """
+    Import NLW Peniarth manuscripts.
+
+    By default an executing run skips manuscripts that an interrupted
+    earlier run already committed; resume=False starts over. The progress
+    file is removed once a run completes, so the next run imports
+    everything again.
+    """
     if verbose:
         logger.setLevel(logging.DEBUG)
 
@@ -542,10 +708,14 @@ def import_nlw(
 
     if items is None and not skip_discovery:
         logger.info("No discovery cache found. Running crawl4ai discovery...")
+        partial_path = partial_cache_path(cache_path)
         items = asyncio.run(
-            discover_manuscripts(test_mode=test_mode, limit=limit)
+            discover_manuscripts(
+                test_mode=test_mode, limit=limit, partial_path=partial_path,
+            )
         )
         save_discovery_cache(items, cache_path)
+        partial_path.unlink(missing_ok=True)
     elif items is not None:
         # Apply limits to cached data
         if test_mode:
@@ -576,57 +746,32 @@ def import_nlw(
         logger.info("  sqlite3 database/compilatio.db < database/schema.sql")
         return False
 
-    records = []
-    fetch_errors = 0
-
-    for i, item in enumerate(items_with_pids):
-        pid = item["pid"]
-        manifest_url = f"{IIIF_BASE}/{pid}/manifest.json"
-
-        logger.info(
-            f"[{i+1}/{len(items_with_pids)}] "
-            f"Fetching manifest for {item.get('shelfmark', pid)}"
-        )
-
-        manifest_data = fetch_json(manifest_url)
-        if not manifest_data:
-            fetch_errors += 1
-            continue
-
-        record = parse_manifest(manifest_data, manifest_url, item)
-        if record:
-            records.append(record)
-            logger.debug(f"  -> {record['shelfmark']}")
-        else:
-            logger.warning(f"  -> Could not parse manifest for {pid}")
-            fetch_errors += 1
-
-        if i < len(items_with_pids) - 1:
-            time.sleep(MANIFEST_DELAY)
-
-        if (i + 1) % 25 == 0:
+    # Skip manuscripts an interrupted earlier run already committed
+    progress_path = progress_path_for(cache_path)
+    if resume:
+        completed = load_completed_pids(progress_path)
+        if completed:
+            items_with_pids = [
+                item for item in items_with_pids if item["pid"] not in completed
+            ]
             logger.info(
-                f"Progress: {i+1}/{len(items_with_pids)} manifests, "
-                f"{len(records)} parsed"
+                f"Resuming: {len(completed)} already imported, "
+                f"{len(items_with_pids)} remaining"
             )
 
-    logger.info(
-        f"Fetched {len(items_with_pids)} manifests, "
-        f"parsed {len(records)} records, {fetch_errors} errors"
-    )
-
-    # Phase 3: Database operations
-    conn = sqlite3.connect(db_path)
+    # Phase 3 (database) runs alongside the fetch: when executing, parsed
+    # records are written and committed in batches while later manifests
+    # are still downloading, and each committed PID goes to the progress
+    # file so an interrupted run can be resumed.
+    conn = sqlite3.connect(db_path, isolation_level=None)
     cursor = conn.cursor()
 
-    repo_id = ensure_repository(cursor) if not dry_run else 1
-
     stats = {
         "discovery_total": len(items),
         "discovery_with_pids": len(items_with_pids),
         "manifests_fetched": len(items_with_pids),
-        "records_parsed": len(records),
-        "fetch_errors": fetch_errors,
+        "records_parsed": 0,
+        "fetch_errors": 0,
         "inserted": 0,
         "updated": 0,
         "db_errors": 0,
@@ -634,129 +779,133 @@ def import_nlw(
 
     results = {"inserted": [], "updated": []}
 
-    for record in records:
-        shelfmark = record["shelfmark"]
+    progress = None
+    if not dry_run:
+        tune_import_connection(conn)
+        progress_path.parent.mkdir(parents=True, exist_ok=True)
+        progress = open(progress_path, "a" if resume else "w")
 
+    try:
         if dry_run:
-            cursor.execute(
-                "SELECT id FROM manuscripts WHERE shelfmark = ?",
-                (shelfmark,),
-            )
-            if cursor.fetchone():
-                stats["updated"] += 1
-                results["updated"].append(record)
-            else:
-                stats["inserted"] += 1
-                results["inserted"].append(record)
+            repo_id = 1
+            existing = load_existing_shelfmarks(cursor)
         else:
-            try:
-                existing_id = manuscript_exists(cursor, shelfmark, repo_id)
-
-                if existing_id:
-                    cursor.execute(
-                        """
-                        UPDATE manuscripts SET
-                            collection = ?, date_display = ?, date_start = ?,
-                            date_end = ?, contents = ?, provenance = ?,
-                            language = ?, folios = ?, iiif_manifest_url = ?,
-                            thumbnail_url = ?, source_url = ?
-                        WHERE id = ?
-                    """,
-                        (
-                            record.get("collection"),
-                            record.get("date_display"),
-                            record.get("date_start"),
-                            record.get("date_end"),
-                            record.get("contents"),
-                            record.get("provenance"),
-                            record.get("language"),
-                            record.get("folios"),
-                            record["iiif_manifest_url"],
-                            record.get("thumbnail_url"),
-                            record.get("source_url"),
-                            existing_id,
-                        ),
-                    )
+            cursor.execute("BEGIN IMMEDIATE")
+            repo_id = ensure_repository(cursor)
+            ensure_shelfmark_index(cursor)
+            since_id = last_manuscript_id(cursor)
+            conn.commit()
+
+        batch = []
+        for item, manifest_url, manifest_data in fetch_all_manifests(
+            items_with_pids, use_cache=use_cache, refresh=refresh,
+        ):
+            if not manifest_data:
+                stats["fetch_errors"] += 1
+                continue
+
+            record = parse_manifest(manifest_data, manifest_url, item)
+            if not record:
+                logger.warning(f"  -> Could not parse manifest for {item['pid']}")
+                stats["fetch_errors"] += 1
+                continue
+
+            stats["records_parsed"] += 1
+            logger.debug(f"  -> {record['shelfmark']}")
+
+            if dry_run:
+                if record["shelfmark"] in existing:
                     stats["updated"] += 1
+                    results["updated"].append(record)
                 else:
-                    cursor.execute(
-                        """
-                        INSERT INTO manuscripts (
-                            repository_id, shelfmark, collection, date_display,
-                            date_start, date_end, contents, provenance, language,
-                            folios, iiif_manifest_url, thumbnail_url, source_url
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                        (
-                            repo_id,
-                            shelfmark,
-                            record.get("collection"),
-                            record.get("date_display"),
-                            record.get("date_start"),
-                            record.get("date_end"),
-                            record.get("contents"),
-                            record.get("provenance"),
-                            record.get("language"),
-                            record.get("folios"),
-                            record["iiif_manifest_url"],
-                            record.get("thumbnail_url"),
-                            record.get("source_url"),
-                        ),
-                    )
                     stats["inserted"] += 1
+                    results["inserted"].append(record)
+                continue
+
+            record["pid"] = item["pid"]
+            batch.append(record)
+            if len(batch) >= WRITE_BATCH_SIZE:
+                stats["db_errors"] += commit_batch(conn, batch, repo_id, progress)
+                batch = []
 
-            except Exception as e:
-                stats["db_errors"] += 1
-                logger.error(f"Error importing {shelfmark}: {e}")
+        logger.info(
+            f"Fetched {len(items_with_pids)} manifests, "
+            f"parsed {stats['records_parsed']} records, "
+            f"{stats['fetch_errors']} errors"
+        )
+
+        if not dry_run:
+            stats["db_errors"] += commit_batch(conn, batch, repo_id, progress)
+            # Rows past the ID watermark are new; every other success was
+            # an update (including a shelfmark listed twice in this run)
+            stats["inserted"] = cursor.execute(
+                "SELECT COUNT(*) FROM manuscripts WHERE repository_id = ? AND id > ?",
+                (repo_id, since_id),
+            ).fetchone()[0]
+            stats["updated"] = (
+                stats["records_parsed"] - stats["db_errors"] - stats["inserted"]
+            )
+    except BaseException:
+        if not dry_run:
+            conn.rollback()
+        conn.close()
+        raise
+    finally:
+        if progress is not None:
+            progress.close()
 
     if not dry_run:
-        conn.commit()
+        progress_path.unlink(missing_ok=True)  # Run complete; next one starts over
     conn.close()
 
-    # Print summary
-    print("\n" + "=" * 70)
+    # Summary (buffered and written to stdout in one go)
+    buf = io.StringIO()
+    print("\n" + "=" * 70, file=buf)
     print(
         f"{'DRY RUN - ' if dry_run else ''}"
-        "NATIONAL LIBRARY OF WALES (PENIARTH) IMPORT SUMMARY"
+        "NATIONAL LIBRARY OF WALES (PENIARTH) IMPORT SUMMARY",
+        file=buf,
     )
-    print("=" * 70)
-    print(f"\nDiscovery (archives.library.wales):")
-    print(f"  Total items found:    {stats['discovery_total']}")
-    print(f"  Items with PIDs:      {stats['discovery_with_pids']}")
-    print(f"\nIIIF Manifest Fetch (damsssl.llgc.org.uk):")
-    print(f"  Manifests fetched:    {stats['manifests_fetched']}")
-    print(f"  Records parsed:       {stats['records_parsed']}")
-    print(f"  Fetch errors:         {stats['fetch_errors']}")
-    print(f"\nDatabase Operations {'(would be)' if dry_run else ''}:")
-    print(f"  {'Would insert' if dry_run else 'Inserted'}:  {stats['inserted']}")
-    print(f"  {'Would update' if dry_run else 'Updated'}:   {stats['updated']}")
-    print(f"  Errors:               {stats['db_errors']}")
+    print("=" * 70, file=buf)
+    print(f"\nDiscovery (archives.library.wales):", file=buf)
+    print(f"  Total items found:    {stats['discovery_total']}", file=buf)
+    print(f"  Items with PIDs:      {stats['discovery_with_pids']}", file=buf)
+    print(f"\nIIIF Manifest Fetch (damsssl.llgc.org.uk):", file=buf)
+    print(f"  Manifests fetched:    {stats['manifests_fetched']}", file=buf)
+    print(f"  Records parsed:       {stats['records_parsed']}", file=buf)
+    print(f"  Fetch errors:         {stats['fetch_errors']}", file=buf)
+    print(f"\nDatabase Operations {'(would be)' if dry_run else ''}:", file=buf)
+    print(f"  {'Would insert' if dry_run else 'Inserted'}:  {stats['inserted']}", file=buf)
+    print(f"  {'Would update' if dry_run else 'Updated'}:   {stats['updated']}", file=buf)
+    print(f"  Errors:               {stats['db_errors']}", file=buf)
 
     if results.get("inserted"):
-        print("\n" + "-" * 70)
-        print(f"RECORDS TO {'INSERT' if dry_run else 'INSERTED'} (sample):")
-        print("-" * 70)
+        print("\n" + "-" * 70, file=buf)
+        print(f"RECORDS TO {'INSERT' if dry_run else 'INSERTED'} (sample):", file=buf)
+        print("-" * 70, file=buf)
         for rec in results["inserted"][:10]:
             date = (
                 f" ({rec.get('date_display', '')})"
                 if rec.get("date_display")
                 else ""
             )
-            print(f"  {rec['shelfmark']}{date}")
+            print(f"  {rec['shelfmark']}{date}", file=buf)
             if rec.get("contents"):
                 contents = rec["contents"]
                 if len(contents) > 70:
                     contents = contents[:70] + "..."
-                print(f"    {contents}")
+                print(f"    {contents}", file=buf)
         remaining = len(results["inserted"]) - 10
         if remaining > 0:
-            print(f"  ... and {remaining} more")
+            print(f"  ... and {remaining} more", file=buf)
 
     if dry_run:
-        print("\n" + "=" * 70)
-        print("This was a DRY RUN. No changes were made to the database.")
-        print("Run with --execute to apply changes.")
-        print("=" * 70)
+        print("\n" + "=" * 70, file=buf)
+        print("This was a DRY RUN. No changes were made to the database.", file=buf)
+        print("Run with --execute to apply changes.", file=buf)
+        print("=" * 70, file=buf)
+
+    sys.stdout.write(buf.getvalue())
 
     return True
 
@@ -809,6 +958,21 @@ def main():
         default=None,
         help="Limit number of manuscripts to process",
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the on-disk manifest cache",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Revalidate cached manifests with the server",
+    )
+    parser.add_argument(
+        "--fresh",
+        action="store_true",
+        help="Start over instead of resuming an interrupted earlier run",
+    )
 
     args = parser.parse_args()
 
@@ -835,6 +999,9 @@ def main():
         limit=args.limit,
         discover_only=args.discover_only,
         skip_discovery=args.skip_discovery,
+        use_cache=not args.no_cache,
+        refresh=args.refresh,
+        resume=not args.fresh,
     )
     sys.exit(0 if success else 1)
 
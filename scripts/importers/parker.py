@@ -8,14 +8,17 @@ hosted by Stanford University Libraries.
 The Parker catalogue has aggressive bot protection that blocks automated access.
 This script supports two discovery modes:
   1. --from-html: Parse manually-saved HTML files (recommended)
-  2. crawl4ai: Attempt browser-based crawling (usually blocked)
+  2. Crawl: plain HTTP first, then crawl4ai browser crawling (usually blocked)
 
 Two-phase process:
   Phase 1 (Discovery): Extract druid/shelfmark mappings from HTML
-  Phase 2 (Import): Fetch IIIF manifests and parse metadata
+  Phase 2 (Import): Fetch IIIF manifests (concurrently when aiohttp is
+    installed), parse metadata, and commit records in batches as they arrive
 
 Dependencies:
     pip install beautifulsoup4
+    pip install lxml    # optional, faster HTML parsing
+    pip install aiohttp # optional, concurrent manifest fetching
     # crawl4ai only needed if not using --from-html
 
 Usage:
@@ -30,6 +33,8 @@ Usage:
     # Other options
     python scripts/importers/parker.py --test             # First 5 only
     python scripts/importers/parker.py --verbose          # Detailed logging
+    python scripts/importers/parker.py --refresh          # Revalidate cached manifests
+    python scripts/importers/parker.py --no-cache         # Bypass the manifest cache
 
 Source:
     https://parker.stanford.edu/parker/browse/browse-by-manuscript-number
@@ -44,18 +49,38 @@ Manual HTML Download Instructions:
 
 import argparse
 import asyncio
-import json
 import logging
+import mmap
+import os
 import re
 import sqlite3
 import sys
-import time
-from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import AsyncExitStack
+from html import unescape
 from pathlib import Path
-from typing import Optional
-from urllib.request import Request, urlopen
+from typing import Optional, Union
 from urllib.error import HTTPError, URLError
 
+from _iiif_utils import (
+    ASYNC_HTTP_AVAILABLE,
+    HTML_PARSER,
+    RETRY_STATUSES,
+    ImportProgress,
+    RateLimiter,
+    ensure_shelfmark_index,
+    http_get,
+    index_metadata,
+    iter_manifests_background,
+    iter_manifests_sync,
+    json_dumps,
+    json_loads,
+    load_manuscript_ids,
+    metadata_value,
+    tune_import_connection,
+    write_records,
+)
+
 # =============================================================================
 # Constants and Paths
 # =============================================================================
@@ -80,9 +105,37 @@ CATALOG_BASE_URL = (
 PURL_BASE = "https://purl.stanford.edu"
 MANIFEST_TEMPLATE = f"{PURL_BASE}/{{druid}}/iiif/manifest"
 
+# Regex patterns (compiled once; used for every catalog link and manifest)
+DRUID_PATTERN = re.compile(r"/catalog/([a-z]{2}\d{3}[a-z]{2}\d{4})")
+SHELFMARK_PATTERN = re.compile(r"MS\.?\s*(\d+[A-Za-z]?)")
+TITLE_PREFIX_PATTERN = re.compile(r"^Cambridge,?\s*Corpus Christi College,?\s*")
+TITLE_MS_PATTERN = re.compile(r"^MS\.?\s*\d+[A-Za-z]?\s*[:\-–]?\s*")
+# Catalog <a> tags in raw HTML bytes: every one, and those whose content is
+# plain text (matched on bytes so only the captured link text gets decoded)
+CATALOG_ANCHOR_PATTERN = re.compile(
+    rb"<a\s[^>]*?href=[\"'][^\"']*?/catalog/[a-z]{2}\d{3}[a-z]{2}\d{4}"
+)
+CATALOG_TEXT_LINK_PATTERN = re.compile(
+    rb"<a\s[^>]*?href=[\"'][^\"']*?/catalog/([a-z]{2}\d{3}[a-z]{2}\d{4})"
+    rb"[^\"']*[\"'][^>]*>([^<]*)</a>"
+)
+YEAR_PATTERN = re.compile(r"\b(\d{4})\b")
+CENTURY_PATTERN = re.compile(r"(\d{1,2})(?:st|nd|rd|th)\s*century", re.IGNORECASE)
+
+# Saved catalog pages are parsed in worker processes from this many files up
+HTML_POOL_MIN_FILES = 4
+
+# Manifests between full progress checkpoints (events are logged in between)
+PROGRESS_CHECKPOINT_EVERY = 25
+WRITE_BATCH_SIZE = 50  # records per commit while manifests are still arriving
+
 # Rate limiting
 CRAWL_DELAY = 5.0  # seconds between page crawls
-MANIFEST_DELAY = 0.3  # seconds between manifest fetches
+MANIFEST_DELAY = 0.3  # seconds between manifest fetches (steady state)
+MANIFEST_BURST = 5  # fetches allowed back to back after an idle spell
+MAX_CONCURRENCY = 8  # concurrent manifest requests when aiohttp is available
+# Rate limiting plus transient gateway errors from the Stanford PURL service
+TRANSIENT_STATUSES = RETRY_STATUSES | {502, 504}
 
 # Logging
 logging.basicConfig(
@@ -99,21 +152,39 @@ USER_AGENT = "Compilatio/1.0 (Academic manuscript research; IIIF aggregator)"
 # =============================================================================
 
 
-def fetch_json(url: str, retries: int = 3) -> Optional[dict]:
-    """Fetch a URL and parse as JSON with retry logic."""
-    for attempt in range(retries):
-        try:
-            req = Request(url, headers={"User-Agent": USER_AGENT})
-            with urlopen(req, timeout=30) as resp:
-                return json.loads(resp.read().decode("utf-8"))
-        except (HTTPError, URLError, json.JSONDecodeError, TimeoutError) as e:
-            if attempt < retries - 1:
-                logger.debug(f"Retry {attempt + 1}/{retries} for {url}: {e}")
-                time.sleep(1)
-            else:
-                logger.warning(f"Failed to fetch {url}: {e}")
-                return None
-    return None
+def fetch_all_manifests(
+    items: list[dict], use_cache: bool = True, refresh: bool = False,
+):
+    """
+    Fetch the IIIF manifest of every item, yielding (item, url, manifest).
+
+    With aiohttp, up to MAX_CONCURRENCY requests share one keep-alive
+    session on a background thread, paced to one per MANIFEST_DELAY after
+    an initial burst, and results arrive in completion order so parsing
+    overlaps the remaining fetches; otherwise falls back to sequential
+    urllib. Both read and fill the on-disk manifest cache unless use_cache
+    is False. manifest is None when a fetch failed.
+    """
+    urls = [MANIFEST_TEMPLATE.format(druid=item["druid"]) for item in items]
+    logger.info(f"Fetching {len(urls)} IIIF manifests")
+    if ASYNC_HTTP_AVAILABLE:
+        for i, manifest in iter_manifests_background(
+            urls,
+            USER_AGENT,
+            max_concurrency=MAX_CONCURRENCY,
+            rate=1 / MANIFEST_DELAY,
+            use_cache=use_cache,
+            refresh=refresh,
+            retry_statuses=TRANSIENT_STATUSES,
+        ):
+            yield items[i], urls[i], manifest
+    else:
+        manifests = iter_manifests_sync(
+            urls, USER_AGENT, RateLimiter(MANIFEST_DELAY, burst=MANIFEST_BURST),
+            use_cache=use_cache, refresh=refresh,
+            retry_statuses=TRANSIENT_STATUSES, retry_base=0.5,
+        )
+        yield from zip(items, urls, manifests)
 
 
 # =============================================================================
@@ -121,18 +192,142 @@ def fetch_json(url: str, retries: int = 3) -> Optional[dict]:
 # =============================================================================
 
 
+def clean_title(title: str) -> str:
+    """
+    Strip a leading "Cambridge, Corpus Christi College" and "MS ###" from a title.
+
+    Both patterns are anchored on a literal word, so the regexes only run
+    for titles that start with it.
+    """
+    if title.startswith("Cambridge"):
+        title = TITLE_PREFIX_PATTERN.sub("", title, count=1)
+    if title.startswith("MS"):
+        title = TITLE_MS_PATTERN.sub("", title, count=1)
+    return title.strip()
+
+
+def scan_catalog_links(html: Union[bytes, mmap.mmap]) -> Optional[list[dict]]:
+    """
+    Regex fast path for parse_html_file over the raw page bytes.
+
+    Only valid when every catalog link is plain text and each druid's first
+    link names its shelfmark; otherwise returns None and the page goes
+    through BeautifulSoup, which can look at the link's parent element.
+    The page itself is never decoded, only the druids and link texts.
+    """
+    links = CATALOG_TEXT_LINK_PATTERN.findall(html)
+    if len(links) != len(CATALOG_ANCHOR_PATTERN.findall(html)):
+        return None  # Some catalog link contains markup
+
+    manuscripts = []
+    seen_druids = set()
+    for druid, text in links:
+        if druid in seen_druids:
+            continue
+        seen_druids.add(druid)
+
+        try:
+            link_text = unescape(text.decode("utf-8")).strip()
+        except UnicodeDecodeError:
+            return None
+        shelfmark_match = SHELFMARK_PATTERN.search(link_text)
+        if not shelfmark_match:
+            return None
+
+        title = clean_title(link_text)
+
+        manuscripts.append({
+            "druid": druid.decode("ascii"),
+            "shelfmark": f"MS {shelfmark_match.group(1)}",
+            "title": title if title else None,
+        })
+
+    return manuscripts
+
+
+def parse_html_file(html_file: Path) -> list[dict]:
+    """
+    Extract manuscripts from one saved catalog page, in link order.
+
+    Each druid appears once (its first link wins). Pages are scanned with
+    scan_catalog_links when possible and parsed with BeautifulSoup when
+    not. Pure function of the file, so pages can be parsed in worker
+    processes.
+    """
+    with open(html_file, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        # Scan the page through a read-only mapping rather than a copy
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            manuscripts = scan_catalog_links(mm)
+            raw = mm[:] if manuscripts is None else None
+    if manuscripts is not None:
+        return manuscripts
+
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(raw, HTML_PARSER)
+
+    manuscripts = []
+    seen_druids = set()
+    for link in soup.select('a[href*="/catalog/"]'):
+        href = link.get("href", "")
+        # Extract druid from URL like /parker/catalog/wz026zp2442
+        match = DRUID_PATTERN.search(href)
+        if not match:
+            continue
+
+        druid = match.group(1)
+
+        # Skip if already found
+        if druid in seen_druids:
+            continue
+        seen_druids.add(druid)
+
+        # Get link text for title/shelfmark
+        link_text = link.get_text(strip=True)
+
+        # Extract shelfmark: "MS ###" pattern
+        shelfmark = None
+        shelfmark_match = SHELFMARK_PATTERN.search(link_text)
+        if shelfmark_match:
+            shelfmark = f"MS {shelfmark_match.group(1)}"
+        else:
+            # Try parent element
+            parent = link.find_parent(["div", "article", "li"])
+            if parent:
+                parent_text = parent.get_text(" ", strip=True)
+                shelfmark_match = SHELFMARK_PATTERN.search(parent_text)
+                if shelfmark_match:
+                    shelfmark = f"MS {shelfmark_match.group(1)}"
+
+        if not shelfmark:
+            shelfmark = f"MS {druid}"
+
+        # Get title - clean up
+        title = clean_title(link_text)
+
+        manuscripts.append({
+            "druid": druid,
+            "shelfmark": shelfmark,
+            "title": title if title else None,
+        })
+
+    return manuscripts
+
+
 def discover_from_html(html_dir: Path, verbose: bool = False) -> list[dict]:
     """
     Parse manually-saved HTML files to discover manuscripts.
 
     Expects files named page1.html, page2.html, etc. in html_dir.
     Looks for druid links and shelfmarks in document-thumbnail divs.
+    With several pages, each is parsed in its own worker process.
 
     Returns list of dicts with: druid, shelfmark, title
     """
-    from bs4 import BeautifulSoup
-
     manuscripts = []
+    seen_druids = set()
     html_files = sorted(html_dir.glob("page*.html"))
 
     if not html_files:
@@ -145,64 +340,22 @@ def discover_from_html(html_dir: Path, verbose: bool = False) -> list[dict]:
 
     logger.info(f"Found {len(html_files)} HTML files in {html_dir}")
 
-    for html_file in html_files:
-        logger.info(f"Parsing {html_file.name}...")
-
-        with open(html_file, "r", encoding="utf-8") as f:
-            soup = BeautifulSoup(f.read(), "html.parser")
-
-        # Look for document-thumbnail divs with manifest links
-        thumbnails = soup.select("div.document-thumbnail")
-        if verbose:
-            logger.debug(f"  Found {len(thumbnails)} document-thumbnail divs")
-
-        # Also look for catalog links as fallback
-        catalog_links = soup.select('a[href*="/catalog/"]')
+    # Process start-up only pays off once there are a few pages to spread
+    if len(html_files) >= HTML_POOL_MIN_FILES and (os.cpu_count() or 1) > 1:
+        with ProcessPoolExecutor() as executor:
+            per_file = list(executor.map(parse_html_file, html_files))
+    else:
+        per_file = map(parse_html_file, html_files)
 
+    # Merge in page order; a druid already seen on an earlier page is skipped
+    for html_file, found in zip(html_files, per_file):
+        logger.info(f"Parsed {html_file.name}")
         items_found = 0
-        for link in catalog_links:
-            href = link.get("href", "")
-            # Extract druid from URL like /parker/catalog/wz026zp2442
-            match = re.search(r"/catalog/([a-z]{2}\d{3}[a-z]{2}\d{4})", href)
-            if not match:
-                continue
-
-            druid = match.group(1)
-
-            # Skip if already found
-            if any(m["druid"] == druid for m in manuscripts):
+        for item in found:
+            if item["druid"] in seen_druids:
                 continue
-
-            # Get link text for title/shelfmark
-            link_text = link.get_text(strip=True)
-
-            # Extract shelfmark: "MS ###" pattern
-            shelfmark = None
-            shelfmark_match = re.search(r"MS\.?\s*(\d+[A-Za-z]?)", link_text)
-            if shelfmark_match:
-                shelfmark = f"MS {shelfmark_match.group(1)}"
-            else:
-                # Try parent element
-                parent = link.find_parent(["div", "article", "li"])
-                if parent:
-                    parent_text = parent.get_text(" ", strip=True)
-                    shelfmark_match = re.search(r"MS\.?\s*(\d+[A-Za-z]?)", parent_text)
-                    if shelfmark_match:
-                        shelfmark = f"MS {shelfmark_match.group(1)}"
-
-            if not shelfmark:
-                shelfmark = f"MS {druid}"
-
-            # Get title - clean up
-            title = link_text
-            title = re.sub(r"^Cambridge,?\s*Corpus Christi College,?\s*", "", title)
-            title = re.sub(r"^MS\.?\s*\d+[A-Za-z]?\s*[:\-–]?\s*", "", title).strip()
-
-            manuscripts.append({
-                "druid": druid,
-                "shelfmark": shelfmark,
-                "title": title if title else None,
-            })
+            seen_druids.add(item["druid"])
+            manuscripts.append(item)
             items_found += 1
 
         logger.info(f"  Found {items_found} new manuscripts (total: {len(manuscripts)})")
@@ -212,20 +365,28 @@ def discover_from_html(html_dir: Path, verbose: bool = False) -> list[dict]:
 
 
 # =============================================================================
-# Phase 1b: Discovery via crawl4ai (usually blocked)
+# Phase 1b: Discovery via HTTP / crawl4ai (usually blocked)
 # =============================================================================
 
 
-async def discover_manuscripts(
-    test_mode: bool = False,
-    limit: int = None,
-) -> list[dict]:
+def fetch_catalog_html(url: str) -> Optional[str]:
     """
-    Crawl Parker catalog pages to discover all manuscripts.
+    Fetch a catalog page over plain HTTP.
 
-    Returns list of dicts with: druid, shelfmark, title
+    Returns None when the request fails or the bot protection answered
+    instead of the catalog (no druid links on the page).
     """
-    from bs4 import BeautifulSoup
+    try:
+        with http_get(url, {"User-Agent": USER_AGENT, "Accept": "text/html"}) as resp:
+            html = resp.read().decode("utf-8", errors="replace")
+    except (HTTPError, URLError) as e:
+        logger.debug(f"Plain HTTP fetch failed for {url}: {e}")
+        return None
+    return html if DRUID_PATTERN.search(html) else None
+
+
+async def start_crawler(stack: AsyncExitStack):
+    """Start a crawl4ai browser on the exit stack; returns (crawler, run config)."""
     from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig
 
     browser_config = BrowserConfig(
@@ -237,12 +398,35 @@ async def discover_manuscripts(
         page_timeout=60000,
         delay_before_return_html=8.0,  # Wait for JS to render
     )
+    crawler = await stack.enter_async_context(
+        AsyncWebCrawler(config=browser_config)
+    )
+    return crawler, crawl_config
+
+
+async def discover_manuscripts(
+    test_mode: bool = False,
+    limit: int = None,
+) -> list[dict]:
+    """
+    Crawl Parker catalog pages to discover all manuscripts.
+
+    Blacklight renders the result list server-side, so each page is first
+    requested over plain HTTP. The crawl4ai browser is only started once
+    that is blocked, and then used for the remaining pages.
+
+    Returns list of dicts with: druid, shelfmark, title
+    """
+    from bs4 import BeautifulSoup
 
     manuscripts = []
+    seen_druids = set()
     page_num = 1
     max_pages = 10 if not test_mode else 1
+    use_http = True
+    crawler = None
 
-    async with AsyncWebCrawler(config=browser_config) as crawler:
+    async with AsyncExitStack() as stack:
         while page_num <= max_pages:
             # Build URL with page number
             url = CATALOG_BASE_URL
@@ -251,9 +435,20 @@ async def discover_manuscripts(
 
             logger.info(f"Crawling catalog page {page_num}...")
 
+            html = None
+            if use_http:
+                html = await asyncio.to_thread(fetch_catalog_html, url)
+                if html is None:
+                    logger.info("  Plain HTTP fetch blocked; switching to crawl4ai")
+                    use_http = False
+
             try:
-                result = await crawler.arun(url=url, config=crawl_config)
-                soup = BeautifulSoup(result.html, "html.parser")
+                if html is None:
+                    if crawler is None:
+                        crawler, crawl_config = await start_crawler(stack)
+                    result = await crawler.arun(url=url, config=crawl_config)
+                    html = result.html
+                soup = BeautifulSoup(html, HTML_PARSER)
             except Exception as e:
                 logger.error(f"Failed to crawl page {page_num}: {e}")
                 break
@@ -274,21 +469,22 @@ async def discover_manuscripts(
             for link in catalog_links:
                 href = link.get("href", "")
                 # Extract druid from URL like /parker/catalog/wz026zp2442
-                match = re.search(r"/catalog/([a-z]{2}\d{3}[a-z]{2}\d{4})", href)
+                match = DRUID_PATTERN.search(href)
                 if not match:
                     continue
 
                 druid = match.group(1)
 
                 # Skip if already found
-                if any(m["druid"] == druid for m in manuscripts):
+                if druid in seen_druids:
                     continue
+                seen_druids.add(druid)
 
                 # Get link text for title/shelfmark
                 link_text = link.get_text(strip=True)
 
                 # Extract shelfmark: "MS ###" pattern
-                shelfmark_match = re.search(r"MS\.?\s*(\d+[A-Za-z]?)", link_text)
+                shelfmark_match = SHELFMARK_PATTERN.search(link_text)
                 if shelfmark_match:
                     shelfmark = f"MS {shelfmark_match.group(1)}"
                 else:
@@ -296,7 +492,7 @@ async def discover_manuscripts(
                     parent = link.find_parent(["article", "div", "li"])
                     if parent:
                         parent_text = parent.get_text(" ", strip=True)
-                        shelfmark_match = re.search(r"MS\.?\s*(\d+[A-Za-z]?)", parent_text)
+                        shelfmark_match = SHELFMARK_PATTERN.search(parent_text)
                         if shelfmark_match:
                             shelfmark = f"MS {shelfmark_match.group(1)}"
                         else:
@@ -305,9 +501,7 @@ async def discover_manuscripts(
                         shelfmark = f"MS {druid}"
 
                 # Get title - clean up
-                title = link_text
-                title = re.sub(r"^Cambridge,?\s*Corpus Christi College,?\s*", "", title)
-                title = re.sub(r"^MS\.?\s*\d+[A-Za-z]?\s*[:\-–]?\s*", "", title).strip()
+                title = clean_title(link_text)
 
                 manuscripts.append({
                     "druid": druid,
@@ -347,10 +541,9 @@ async def discover_manuscripts(
 
 
 def save_discovery_cache(items: list[dict], cache_path: Path):
-    """Save discovery results to JSON cache."""
+    """Save discovery results to JSON cache (compact; orjson when installed)."""
     cache_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(cache_path, "w") as f:
-        json.dump(items, f, indent=2)
+    cache_path.write_bytes(json_dumps(items))
     logger.info(f"Saved {len(items)} items to {cache_path}")
 
 
@@ -358,8 +551,7 @@ def load_discovery_cache(cache_path: Path) -> Optional[list[dict]]:
     """Load discovery results from JSON cache."""
     if not cache_path.exists():
         return None
-    with open(cache_path) as f:
-        items = json.load(f)
+    items = json_loads(cache_path.read_bytes())
     logger.info(f"Loaded {len(items)} items from cache: {cache_path}")
     return items
 
@@ -369,41 +561,6 @@ def load_discovery_cache(cache_path: Path) -> Optional[list[dict]]:
 # =============================================================================
 
 
-def extract_metadata_value(metadata: list, label: str) -> Optional[str]:
-    """Extract a value from IIIF metadata array by label."""
-    for entry in metadata:
-        entry_label = entry.get("label", "")
-        # Handle both string and dict labels (IIIF v2/v3 variants)
-        if isinstance(entry_label, dict):
-            entry_label = entry_label.get("@value", "") or entry_label.get("en", [""])[0]
-        if isinstance(entry_label, list):
-            entry_label = entry_label[0] if entry_label else ""
-            if isinstance(entry_label, dict):
-                entry_label = entry_label.get("@value", "")
-
-        if not isinstance(entry_label, str):
-            continue
-
-        if entry_label.lower().strip() == label.lower().strip():
-            value = entry.get("value", "")
-            if isinstance(value, list):
-                parts = []
-                for v in value:
-                    if isinstance(v, dict):
-                        parts.append(v.get("@value", str(v)))
-                    else:
-                        parts.append(str(v))
-                value = "; ".join(parts)
-            if isinstance(value, dict):
-                value = value.get("@value", str(value))
-            # Strip HTML tags
-            value = re.sub(r"<[^>]+>", " ", str(value))
-            value = re.sub(r"\s+", " ", value).strip()
-            return value if value else None
-
-    return None
-
-
 def extract_thumbnail_url(manifest: dict) -> Optional[str]:
     """Extract thumbnail URL from manifest."""
     # Try manifest-level thumbnail
@@ -437,20 +594,27 @@ def extract_thumbnail_url(manifest: dict) -> Optional[str]:
 
 def parse_date(date_str: str) -> tuple[Optional[int], Optional[int]]:
     """Parse date string into (start_year, end_year)."""
-    if not date_str:
+    # Both patterns need digits; undated text ("undated", "s. xv") skips them
+    if not date_str or not any(map(str.isdigit, date_str)):
         return None, None
 
+    # Bare "1350" and "1300-1400" need no regex (isdecimal matches what \d does)
+    if len(date_str) == 4 and date_str.isdecimal():
+        year = int(date_str)
+        return year, year
+    if (len(date_str) == 9 and date_str[4] == "-"
+            and date_str[:4].isdecimal() and date_str[5:].isdecimal()):
+        return int(date_str[:4]), int(date_str[5:])
+
     # Try explicit years: "1300-1400", "c. 1350", "ca. 1410"
-    years = re.findall(r"\b(\d{4})\b", date_str)
+    years = YEAR_PATTERN.findall(date_str)
     if len(years) >= 2:
         return int(years[0]), int(years[-1])
     if len(years) == 1:
         return int(years[0]), int(years[0])
 
     # Century patterns: "15th century", "14th-15th century"
-    century_matches = re.findall(
-        r"(\d{1,2})(?:st|nd|rd|th)\s*century", date_str, re.IGNORECASE
-    )
+    century_matches = CENTURY_PATTERN.findall(date_str)
     if century_matches:
         first = (int(century_matches[0]) - 1) * 100
         last = (int(century_matches[-1]) - 1) * 100 + 99
@@ -461,6 +625,8 @@ def parse_date(date_str: str) -> tuple[Optional[int], Optional[int]]:
 
 def count_canvases(manifest: dict) -> int:
     """Count the number of canvases (pages) in a manifest."""
+    if "canvas_count" in manifest:
+        return manifest["canvas_count"]  # Trimmed by load_manifest_subset
     sequences = manifest.get("sequences", [])
     if sequences:
         canvases = sequences[0].get("canvases", [])
@@ -474,7 +640,7 @@ def parse_manifest(manifest_data: dict, manifest_url: str, discovery_item: dict)
 
     Uses discovery data as fallback for missing manifest metadata.
     """
-    metadata = manifest_data.get("metadata", [])
+    fields = index_metadata(manifest_data.get("metadata", []))
     label = manifest_data.get("label", "")
     if isinstance(label, dict):
         label = label.get("@value", "") or str(label)
@@ -483,7 +649,7 @@ def parse_manifest(manifest_data: dict, manifest_url: str, discovery_item: dict)
     shelfmark = discovery_item.get("shelfmark")
     if not shelfmark:
         # Try to extract from label
-        match = re.search(r"MS\.?\s*(\d+[A-Za-z]?)", label)
+        match = SHELFMARK_PATTERN.search(label)
         if match:
             shelfmark = f"MS {match.group(1)}"
         else:
@@ -497,24 +663,23 @@ def parse_manifest(manifest_data: dict, manifest_url: str, discovery_item: dict)
     }
 
     # Title / contents
-    title = extract_metadata_value(metadata, "Title")
+    title = metadata_value(fields, "Title")
     if not title:
         title = label
     if not title:
         title = discovery_item.get("title")
     if title:
         # Clean up shelfmark from title
-        title = re.sub(r"^Cambridge,?\s*Corpus Christi College,?\s*", "", title)
-        title = re.sub(r"^MS\.?\s*\d+[A-Za-z]?\s*[:\-–]?\s*", "", title).strip()
+        title = clean_title(title)
         if len(title) > 1000:
             title = title[:997] + "..."
         if title:
             record["contents"] = title
 
     # Date
-    date_str = extract_metadata_value(metadata, "Date")
+    date_str = metadata_value(fields, "Date")
     if not date_str:
-        date_str = extract_metadata_value(metadata, "Date of Creation")
+        date_str = metadata_value(fields, "Date of Creation")
     if date_str:
         record["date_display"] = date_str
         start, end = parse_date(date_str)
@@ -524,19 +689,19 @@ def parse_manifest(manifest_data: dict, manifest_url: str, discovery_item: dict)
             record["date_end"] = end
 
     # Language
-    language = extract_metadata_value(metadata, "Language")
+    language = metadata_value(fields, "Language")
     if language:
         record["language"] = language
 
     # Physical description
-    extent = extract_metadata_value(metadata, "Physical Description")
+    extent = metadata_value(fields, "Physical Description")
     if not extent:
-        extent = extract_metadata_value(metadata, "Extent")
+        extent = metadata_value(fields, "Extent")
     if extent:
         record["folios"] = extent
 
     # Provenance
-    provenance = extract_metadata_value(metadata, "Provenance")
+    provenance = metadata_value(fields, "Provenance")
     if provenance:
         record["provenance"] = provenance
 
@@ -561,42 +726,10 @@ def parse_manifest(manifest_data: dict, manifest_url: str, discovery_item: dict)
 # Progress/Checkpoint Management
 # =============================================================================
 
-
-def load_progress(progress_path: Path) -> dict:
-    """Load progress from checkpoint file."""
-    if not progress_path.exists():
-        return {
-            "last_updated": None,
-            "total_discovered": 0,
-            "completed_druids": [],
-            "failed_druids": [],
-        }
-    with open(progress_path) as f:
-        return json.load(f)
-
-
-def save_progress(progress: dict, progress_path: Path):
-    """Save progress to checkpoint file."""
-    progress["last_updated"] = datetime.now(timezone.utc).isoformat()
-    progress_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(progress_path, "w") as f:
-        json.dump(progress, f, indent=2)
-
-
-def mark_completed(progress: dict, druid: str, progress_path: Path):
-    """Mark a druid as completed and save checkpoint."""
-    if druid not in progress["completed_druids"]:
-        progress["completed_druids"].append(druid)
-    if druid in progress["failed_druids"]:
-        progress["failed_druids"].remove(druid)
-    save_progress(progress, progress_path)
-
-
-def mark_failed(progress: dict, druid: str, progress_path: Path):
-    """Mark a druid as failed and save checkpoint."""
-    if druid not in progress["failed_druids"]:
-        progress["failed_druids"].append(druid)
-    save_progress(progress, progress_path)
+# Outcome event kind -> checkpoint field (see _iiif_utils.ImportProgress).
+# The checkpoint is rewritten every PROGRESS_CHECKPOINT_EVERY manifests and
+# outcomes are appended to its event log in between.
+PROGRESS_EVENTS = {"C": "completed_druids", "F": "failed_druids"}
 
 
 # =============================================================================
@@ -628,14 +761,66 @@ def ensure_repository(cursor) -> int:
     return cursor.lastrowid
 
 
-def manuscript_exists(cursor, shelfmark: str, repo_id: int) -> Optional[int]:
-    """Check if manuscript exists. Returns ID if found, None otherwise."""
-    cursor.execute(
-        "SELECT id FROM manuscripts WHERE shelfmark = ? AND repository_id = ?",
-        (shelfmark, repo_id),
+INSERT_SQL = """
+    INSERT INTO manuscripts (
+        repository_id, shelfmark, collection, date_display,
+        date_start, date_end, contents, provenance, language,
+        folios, iiif_manifest_url, thumbnail_url, source_url,
+        image_count
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+UPDATE_SQL = """
+    UPDATE manuscripts SET
+        collection = ?, date_display = ?, date_start = ?,
+        date_end = ?, contents = ?, provenance = ?,
+        language = ?, folios = ?, iiif_manifest_url = ?,
+        thumbnail_url = ?, source_url = ?, image_count = ?
+    WHERE id = ?
+"""
+
+
+def record_fields(record: dict) -> tuple:
+    """Column values shared by INSERT_SQL and UPDATE_SQL, in statement order."""
+    return (
+        record.get("collection"),
+        record.get("date_display"),
+        record.get("date_start"),
+        record.get("date_end"),
+        record.get("contents"),
+        record.get("provenance"),
+        record.get("language"),
+        record.get("folios"),
+        record["iiif_manifest_url"],
+        record.get("thumbnail_url"),
+        record.get("source_url"),
+        record.get("image_count"),
     )
-    row = cursor.fetchone()
-    return row[0] if row else None
+
+
+def commit_batch(
+    conn, records: list[dict], repo_id: int, existing: dict[str, int], progress: dict,
+) -> tuple[int, int, int]:
+    """
+    Write and commit one batch, then log its druids as completed.
+
+    The write lock is taken just for the batch, not while manifests
+    download. Druids are only logged when every row was written, so a
+    failed record is retried by --resume. Returns write_records'
+    (inserted, updated, failed).
+    """
+    if not records:
+        return 0, 0, 0
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    counts = write_records(
+        cursor, records, repo_id, existing, INSERT_SQL, UPDATE_SQL, record_fields,
+    )
+    conn.commit()
+    if not counts[2]:
+        for record in records:
+            progress.mark("C", record["druid"])
+    return counts
 
 
 # =============================================================================
@@ -653,6 +838,8 @@ def import_parker(
     skip_discovery: bool = False,
     resume: bool = False,
     from_html: Path = None,
+    use_cache: bool = True,
+    refresh: bool = False,
 ):
     """Import Parker Library manuscripts."""
     if verbose:
@@ -699,19 +886,23 @@ def import_parker(
         logger.info("  sqlite3 database/compilatio.db < database/schema.sql")
         return False
 
-    # Load progress for resume
-    progress = load_progress(PROGRESS_FILE) if resume else {
-        "last_updated": None,
-        "total_discovered": len(items),
-        "completed_druids": [],
-        "failed_druids": [],
-    }
+    # Load progress for resume (only an executing run records progress)
+    if resume:
+        progress = ImportProgress.load(
+            PROGRESS_FILE, PROGRESS_EVENTS, {"total_discovered": 0},
+        )
+    else:
+        progress = ImportProgress(
+            PROGRESS_FILE, PROGRESS_EVENTS, {"total_discovered": len(items)},
+        )
+        if not dry_run:
+            progress.save()  # Start a fresh checkpoint and log
 
     # Filter out completed items if resuming
     if resume and progress["completed_druids"]:
+        completed = progress["completed_druids"]
         items_to_process = [
-            item for item in items
-            if item["druid"] not in progress["completed_druids"]
+            item for item in items if item["druid"] not in completed
         ]
         logger.info(
             f"Resuming: {len(progress['completed_druids'])} already completed, "
@@ -720,56 +911,18 @@ def import_parker(
     else:
         items_to_process = items
 
-    # Phase 2: Fetch manifests and build records
-    records = []
-    fetch_errors = 0
-
-    for i, item in enumerate(items_to_process):
-        druid = item["druid"]
-        manifest_url = MANIFEST_TEMPLATE.format(druid=druid)
-
-        logger.info(f"[{i+1}/{len(items_to_process)}] Fetching manifest for {item['shelfmark']}")
-
-        manifest_data = fetch_json(manifest_url)
-        if not manifest_data:
-            fetch_errors += 1
-            mark_failed(progress, druid, PROGRESS_FILE)
-            continue
-
-        record = parse_manifest(manifest_data, manifest_url, item)
-        if record:
-            records.append(record)
-            mark_completed(progress, druid, PROGRESS_FILE)
-            logger.debug(f"  -> {record['shelfmark']}")
-        else:
-            logger.warning(f"  -> Could not parse manifest for {druid}")
-            fetch_errors += 1
-            mark_failed(progress, druid, PROGRESS_FILE)
-
-        # Rate limit
-        if i < len(items_to_process) - 1:
-            time.sleep(MANIFEST_DELAY)
-
-        # Progress logging
-        if (i + 1) % 25 == 0:
-            logger.info(f"Progress: {i+1}/{len(items_to_process)} manifests, {len(records)} parsed")
-
-    logger.info(
-        f"Fetched {len(items_to_process)} manifests, "
-        f"parsed {len(records)} records, {fetch_errors} errors"
-    )
-
-    # Database operations
-    conn = sqlite3.connect(db_path)
+    # Phase 2 (manifests) and the database writes run as one pipeline: when
+    # executing, parsed records are written and committed in batches while
+    # later manifests are still downloading, and each committed druid goes
+    # to the progress log for --resume.
+    conn = sqlite3.connect(db_path, isolation_level=None)
     cursor = conn.cursor()
 
-    repo_id = ensure_repository(cursor) if not dry_run else 1
-
     stats = {
         "total_discovered": len(items),
         "manifests_fetched": len(items_to_process),
-        "records_parsed": len(records),
-        "fetch_errors": fetch_errors,
+        "records_parsed": 0,
+        "fetch_errors": 0,
         "inserted": 0,
         "updated": 0,
         "db_errors": 0,
@@ -777,86 +930,88 @@ def import_parker(
 
     results = {"inserted": [], "updated": []}
 
-    for record in records:
-        shelfmark = record["shelfmark"]
+    if not dry_run:
+        tune_import_connection(conn)
+
+    def add_counts(counts):
+        inserted, updated, failed = counts
+        stats["inserted"] += inserted
+        stats["updated"] += updated
+        stats["db_errors"] += failed
 
+    try:
         if dry_run:
-            cursor.execute(
-                "SELECT id FROM manuscripts WHERE shelfmark = ?",
-                (shelfmark,),
-            )
-            if cursor.fetchone():
-                stats["updated"] += 1
-                results["updated"].append(record)
-            else:
-                stats["inserted"] += 1
-                results["inserted"].append(record)
+            row = cursor.execute(
+                "SELECT id FROM repositories WHERE short_name = ?", ("Parker",)
+            ).fetchone()
+            existing = load_manuscript_ids(cursor, row[0]) if row else {}
         else:
-            try:
-                existing_id = manuscript_exists(cursor, shelfmark, repo_id)
-
-                if existing_id:
-                    cursor.execute(
-                        """
-                        UPDATE manuscripts SET
-                            collection = ?, date_display = ?, date_start = ?,
-                            date_end = ?, contents = ?, provenance = ?,
-                            language = ?, folios = ?, iiif_manifest_url = ?,
-                            thumbnail_url = ?, source_url = ?, image_count = ?
-                        WHERE id = ?
-                    """,
-                        (
-                            record.get("collection"),
-                            record.get("date_display"),
-                            record.get("date_start"),
-                            record.get("date_end"),
-                            record.get("contents"),
-                            record.get("provenance"),
-                            record.get("language"),
-                            record.get("folios"),
-                            record["iiif_manifest_url"],
-                            record.get("thumbnail_url"),
-                            record.get("source_url"),
-                            record.get("image_count"),
-                            existing_id,
-                        ),
-                    )
-                    stats["updated"] += 1
+            cursor.execute("BEGIN IMMEDIATE")
+            repo_id = ensure_repository(cursor)
+            ensure_shelfmark_index(cursor)
+            existing = load_manuscript_ids(cursor, repo_id)
+            conn.commit()
+
+        batch = []
+        manifests = fetch_all_manifests(
+            items_to_process, use_cache=use_cache, refresh=refresh,
+        )
+        for i, (item, manifest_url, manifest_data) in enumerate(manifests):
+            druid = item["druid"]
+
+            record = None
+            if not manifest_data:
+                stats["fetch_errors"] += 1
+            else:
+                record = parse_manifest(manifest_data, manifest_url, item)
+                if not record:
+                    logger.warning(f"  -> Could not parse manifest for {druid}")
+                    stats["fetch_errors"] += 1
+
+            if record is None:
+                if not dry_run:
+                    progress.mark("F", druid)
+            else:
+                stats["records_parsed"] += 1
+                logger.debug(f"  -> {record['shelfmark']}")
+                if dry_run:
+                    if record["shelfmark"] in existing:
+                        stats["updated"] += 1
+                        results["updated"].append(record)
+                    else:
+                        stats["inserted"] += 1
+                        results["inserted"].append(record)
                 else:
-                    cursor.execute(
-                        """
-                        INSERT INTO manuscripts (
-                            repository_id, shelfmark, collection, date_display,
-                            date_start, date_end, contents, provenance, language,
-                            folios, iiif_manifest_url, thumbnail_url, source_url,
-                            image_count
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                        (
-                            repo_id,
-                            shelfmark,
-                            record.get("collection"),
-                            record.get("date_display"),
-                            record.get("date_start"),
-                            record.get("date_end"),
-                            record.get("contents"),
-                            record.get("provenance"),
-                            record.get("language"),
-                            record.get("folios"),
-                            record["iiif_manifest_url"],
-                            record.get("thumbnail_url"),
-                            record.get("source_url"),
-                            record.get("image_count"),
-                        ),
-                    )
-                    stats["inserted"] += 1
+                    record["druid"] = druid
+                    batch.append(record)
+                    if len(batch) >= WRITE_BATCH_SIZE:
+                        add_counts(commit_batch(conn, batch, repo_id, existing, progress))
+                        batch = []
+
+            # Progress logging and checkpoint
+            if (i + 1) % PROGRESS_CHECKPOINT_EVERY == 0:
+                logger.info(
+                    f"Progress: {i+1}/{len(items_to_process)} manifests, "
+                    f"{stats['records_parsed']} parsed"
+                )
+                if not dry_run:
+                    progress.save()
+
+        if not dry_run:
+            add_counts(commit_batch(conn, batch, repo_id, existing, progress))
+            progress.save()
 
-            except Exception as e:
-                stats["db_errors"] += 1
-                logger.error(f"Error importing {shelfmark}: {e}")
+        logger.info(
+            f"Fetched {len(items_to_process)} manifests, "
+            f"parsed {stats['records_parsed']} records, "
+            f"{stats['fetch_errors']} errors"
+        )
+    except BaseException:
+        if not dry_run:
+            conn.rollback()
+        conn.close()
+        raise
 
-    if not dry_run:
-        conn.commit()
     conn.close()
 
     # Print summary
@@ -934,6 +1089,16 @@ def main():
         action="store_true",
         help="Skip discovery, use cached data only",
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the on-disk manifest cache",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Revalidate cached manifests with the server",
+    )
     parser.add_argument(
         "--test",
         action="store_true",
@@ -995,6 +1160,8 @@ def main():
         skip_discovery=args.skip_discovery,
         resume=args.resume,
         from_html=args.from_html,
+        use_cache=not args.no_cache,
+        refresh=args.refresh,
     )
     sys.exit(0 if success else 1)
 
@@ -0,0 +1,106 @@
+"""Tests for the shared IIIF importer helpers in _iiif_utils.
+
+Metadata indexing is the unit worth covering: every IIIF importer reads its
+fields through it, and the label/value shapes differ between libraries
+(plain strings at CUDL, @value maps at NLS, bilingual label lists at NLW).
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import json
+
+from _iiif_utils import (
+    _stream_manifest,
+    _trim_manifest,
+    index_metadata,
+    metadata_value,
+)
+
+
+# --- index_metadata -------------------------------------------------------
+
+def test_plain_string_label_and_value():
+    fields = index_metadata([{"label": "Title", "value": "Psalter"}])
+    assert metadata_value(fields, "Title") == "Psalter"
+
+
+def test_lookup_is_case_insensitive():
+    fields = index_metadata([{"label": "Date of Creation", "value": "1400"}])
+    assert metadata_value(fields, "date of creation") == "1400"
+
+
+def test_bilingual_label_list_indexes_every_language():
+    # NLW labels carry English and Welsh variants of the same field.
+    fields = index_metadata([{
+        "label": [{"@value": "Title", "@language": "en"},
+                  {"@value": "Teitl", "@language": "cy-GB"}],
+        "value": "Peniarth MS 1",
+    }])
+    assert metadata_value(fields, "Title") == "Peniarth MS 1"
+    assert metadata_value(fields, "Teitl") == "Peniarth MS 1"
+
+
+def test_iiif3_language_map_label():
+    fields = index_metadata([{"label": {"en": ["Provenance"]}, "value": "Bancroft"}])
+    assert metadata_value(fields, "Provenance") == "Bancroft"
+
+
+def test_multilingual_value_takes_first_language():
+    fields = index_metadata([{
+        "label": {"@value": "Language"},
+        "value": [{"@value": "Latin", "@language": "en"},
+                  {"@value": "Lladin", "@language": "cy-GB"}],
+    }])
+    assert metadata_value(fields, "Language") == "Latin"
+
+
+def test_list_of_strings_is_joined():
+    fields = index_metadata([{"label": "Extent", "value": ["ii", "180 ff."]}])
+    assert metadata_value(fields, "Extent") == "ii; 180 ff."
+
+
+def test_html_is_stripped_and_whitespace_collapsed():
+    fields = index_metadata([{
+        "label": "Provenance",
+        "value": "<p>Given by\n  <i>Archbishop</i>  Bancroft</p>",
+    }])
+    assert metadata_value(fields, "Provenance") == "Given by Archbishop Bancroft"
+
+
+def test_first_entry_wins_for_repeated_label():
+    fields = index_metadata([
+        {"label": "Title", "value": "First"},
+        {"label": "Title", "value": "Second"},
+    ])
+    assert metadata_value(fields, "Title") == "First"
+
+
+def test_missing_and_empty_values_are_none():
+    fields = index_metadata([{"label": "Title", "value": "<br/>"}])
+    assert metadata_value(fields, "Title") is None
+    assert metadata_value(fields, "Shelfmark") is None
+
+
+# --- load_manifest_subset -------------------------------------------------
+
+def test_streamed_and_trimmed_subsets_agree():
+    # Large manifests are streamed, small ones decoded and trimmed; both
+    # must hand the parsers the same fields and first-sequence canvas count.
+    manifest = {
+        "label": "MS 1",
+        "metadata": [{"label": "Title", "value": "Psalter"}],
+        "sequences": [
+            {"canvases": [{"@id": "c1", "images": []}, {"@id": "c2"}]},
+            {"canvases": [{"@id": "other"}]},
+        ],
+        "structures": [{"canvases": ["c1"]}],
+    }
+    raw = json.dumps(manifest).encode()
+    subset = _trim_manifest(json.loads(raw))
+    assert subset["canvas_count"] == 2
+    assert subset["sequences"] == [{"canvases": [{"@id": "c1", "images": []}]}]
+    assert "structures" not in subset
+    assert _stream_manifest(raw) == subset
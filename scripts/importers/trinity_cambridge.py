@@ -14,7 +14,8 @@ Collection: ~850 digitized medieval manuscripts from Trinity College Cambridge
 Source: James Catalogue online (M.R. James catalog, 1900-1904)
 IIIF: Presentation API v2 manifests
 
-No special requirements - uses standard library only.
+No special requirements - uses the standard library and the shared _iiif_utils
+helpers (orjson is used when installed).
 
 Usage:
     python scripts/importers/trinity_cambridge.py                  # Dry-run
@@ -22,23 +23,33 @@ Usage:
     python scripts/importers/trinity_cambridge.py --resume --execute # Resume interrupted
     python scripts/importers/trinity_cambridge.py --test           # First 10 only
     python scripts/importers/trinity_cambridge.py --verbose        # Detailed logging
+    python scripts/importers/trinity_cambridge.py --refresh        # Revalidate cached manifests
+    python scripts/importers/trinity_cambridge.py --no-cache       # Bypass the manifest cache
 
 Note: Full import takes ~30 minutes. Use --resume to continue if interrupted.
 """
 
 import argparse
-import json
 import logging
 import re
 import sqlite3
 import sys
-import time
-import urllib.request
-import urllib.error
-from datetime import datetime, timezone
 from pathlib import Path
+from string import ascii_uppercase
 from typing import Optional
 
+from _iiif_utils import (
+    ASYNC_HTTP_AVAILABLE,
+    RETRY_STATUSES,
+    ImportProgress,
+    RateLimiter,
+    execute_batch,
+    iter_manifests_background,
+    iter_manifests_sync,
+    load_manuscript_ids,
+    tune_import_connection,
+)
+
 # Project paths
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 DB_PATH = PROJECT_ROOT / "database" / "compilatio.db"
@@ -67,11 +78,29 @@ REPO_LOGO_URL = "https://www.trin.cam.ac.uk/assets/images/logo.png"
 CATALOGUE_URL = TRINITY_BASE_URL
 
 # Rate limiting
-REQUEST_DELAY = 0.5  # seconds between manifest requests
+REQUEST_DELAY = 0.5  # seconds between manifest requests (on average)
+REQUEST_BURST = 5  # requests allowed back to back after an idle spell
+MAX_CONCURRENCY = 8  # concurrent manifest requests when aiohttp is available
+# Rate limiting plus transient gateway errors, retried with backoff
+TRANSIENT_STATUSES = RETRY_STATUSES | {502, 504}
+WRITE_BATCH_SIZE = 100  # manuscripts inserted per transaction commit
 
 # Shelfmark pattern: B.x.y, O.x.y, R.x.y, etc. (with optional suffix like 'A')
 SHELFMARK_PATTERN = re.compile(r'\b([A-Z]\.\d+\.\d+[A-Z]?)\b')
 
+# Three- or four-digit years in a date field (e.g. "c. 1350-1400")
+YEAR_PATTERN = re.compile(r'\b(1?\d{3})\b')
+
+# Metadata label substring -> record field, checked in order; the first
+# substring found in the lowercased label wins.
+METADATA_FIELDS = (
+    ("title", "contents"),
+    ("language", "language"),
+    ("date", "date_display"),
+    ("extent", "folios"),
+    ("folio", "folios"),
+)
+
 # =============================================================================
 # Known Shelfmark Ranges
 # =============================================================================
@@ -142,75 +171,43 @@ def generate_shelfmarks() -> list[str]:
     Returns:
         List of shelfmarks to test (e.g., ["B.1.1", "B.1.2", ..., "B.1.30A", ...])
     """
-    shelfmarks = []
+    # Sort naturally (B.1.1, B.1.2, ... B.1.10, B.1.11, ...) on a key built
+    # alongside each shelfmark: (series letter, shelf, number, suffix)
+    keyed = []
 
     for prefix, start, end, extras in SHELFMARK_RANGES:
+        letter, shelf = prefix.split(".")
+        shelf = int(shelf)
+
         # Generate numeric range
-        for i in range(start, end + 1):
-            shelfmarks.append(f"{prefix}.{i}")
+        keyed.extend(
+            ((letter, shelf, i, ""), f"{prefix}.{i}")
+            for i in range(start, end + 1)
+        )
 
         # Add any extras with suffixes
         for extra in extras:
-            shelfmarks.append(f"{prefix}.{extra}")
-
-    # Sort naturally (B.1.1, B.1.2, ... B.1.10, B.1.11, ...)
-    def sort_key(s):
-        parts = re.split(r'[.]', s)
-        result = []
-        for p in parts:
-            # Extract numeric part and suffix
-            match = re.match(r'(\d+)([A-Z]?)', p)
-            if match:
-                result.append((int(match.group(1)), match.group(2)))
-            else:
-                result.append((0, p))
-        return result
-
-    shelfmarks.sort(key=sort_key)
-    return shelfmarks
+            number = extra.rstrip(ascii_uppercase)
+            keyed.append(
+                ((letter, shelf, int(number), extra[len(number):]), f"{prefix}.{extra}")
+            )
 
+    keyed.sort()
+    return [shelfmark for _, shelfmark in keyed]
 
 
 # =============================================================================
 # Progress/Checkpoint Management
 # =============================================================================
 
-def load_progress(progress_path: Path) -> dict:
-    """Load progress from checkpoint file."""
-    if not progress_path.exists():
-        return {
-            "last_updated": None,
-            "total_discovered": 0,
-            "completed_shelfmarks": [],
-            "failed_shelfmarks": [],
-            "phase": "discovery",
-        }
-    with open(progress_path) as f:
-        return json.load(f)
-
-
-def save_progress(progress: dict, progress_path: Path):
-    """Save progress to checkpoint file."""
-    progress["last_updated"] = datetime.now(timezone.utc).isoformat()
-    progress_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(progress_path, "w") as f:
-        json.dump(progress, f, indent=2)
-
-
-def mark_completed(progress: dict, shelfmark: str, progress_path: Path):
-    """Mark a shelfmark as completed and save checkpoint."""
-    if shelfmark not in progress["completed_shelfmarks"]:
-        progress["completed_shelfmarks"].append(shelfmark)
-    if shelfmark in progress["failed_shelfmarks"]:
-        progress["failed_shelfmarks"].remove(shelfmark)
-    save_progress(progress, progress_path)
-
-
-def mark_failed(progress: dict, shelfmark: str, progress_path: Path):
-    """Mark a shelfmark as failed and save checkpoint."""
-    if shelfmark not in progress["failed_shelfmarks"]:
-        progress["failed_shelfmarks"].append(shelfmark)
-    save_progress(progress, progress_path)
+# Outcome event kind -> checkpoint field (see _iiif_utils.ImportProgress).
+# The checkpoint is rewritten at the start and end of a run and after each
+# committed batch; outcomes are appended to its event log in between.
+PROGRESS_EVENTS = {
+    "C": "completed_shelfmarks",
+    "F": "failed_shelfmarks",
+    "N": "not_found_shelfmarks",
+}
 
 
 # =============================================================================
@@ -219,47 +216,46 @@ def mark_failed(progress: dict, shelfmark: str, progress_path: Path):
 
 USER_AGENT = "Compilatio/1.0 (Academic manuscript research; IIIF aggregator)"
 
+# Returned instead of a manifest when the catalogue has none for a shelfmark
+# (HTTP 404), as opposed to None for a fetch that failed and is worth retrying
+NOT_FOUND = object()
 
-def fetch_manifest(shelfmark: str) -> Optional[dict]:
-    """
-    Fetch IIIF manifest for a shelfmark.
-
-    Args:
-        shelfmark: Manuscript shelfmark (e.g., "B.1.1")
 
-    Returns:
-        Parsed manifest dict or None on error (including 404)
+def fetch_all_manifests(
+    shelfmarks: list[str], use_cache: bool = True, refresh: bool = False,
+):
     """
-    url = f"{MANIFEST_BASE}/{shelfmark}.json"
-
-    try:
-        request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
-        with urllib.request.urlopen(request, timeout=30) as response:
-            if response.status != 200:
-                logger.debug(f"HTTP {response.status} for {shelfmark}")
-                return None
-
-            data = response.read().decode('utf-8')
-            return json.loads(data)
-
-    except urllib.error.HTTPError as e:
-        if e.code == 404:
-            logger.debug(f"Not found: {shelfmark}")
-        else:
-            logger.warning(f"HTTP {e.code} for {shelfmark}")
-        return None
-
-    except urllib.error.URLError as e:
-        logger.error(f"URL error for {shelfmark}: {e}")
-        return None
-
-    except json.JSONDecodeError:
-        logger.error(f"Invalid JSON for {shelfmark}")
-        return None
-
-    except Exception as e:
-        logger.error(f"Error fetching manifest for {shelfmark}: {e}")
-        return None
+    Fetch the manifest of every shelfmark, yielding (shelfmark, manifest).
+
+    With aiohttp, up to MAX_CONCURRENCY requests share one keep-alive
+    session on a background thread and results arrive in completion order,
+    so parsing and inserts overlap the remaining fetches; otherwise falls
+    back to sequential urllib fetches. Either way a token bucket
+    paces requests to one per REQUEST_DELAY on average after an initial
+    burst. Both read and fill the on-disk manifest cache unless use_cache
+    is False, and cache hits are not paced. manifest is NOT_FOUND for a
+    404 and None for a failed fetch.
+    """
+    urls = [f"{MANIFEST_BASE}/{shelfmark}.json" for shelfmark in shelfmarks]
+    if ASYNC_HTTP_AVAILABLE:
+        for i, manifest in iter_manifests_background(
+            urls,
+            USER_AGENT,
+            max_concurrency=MAX_CONCURRENCY,
+            rate=1 / REQUEST_DELAY,
+            use_cache=use_cache,
+            refresh=refresh,
+            retry_statuses=TRANSIENT_STATUSES,
+            not_found=NOT_FOUND,
+        ):
+            yield shelfmarks[i], manifest
+    else:
+        manifests = iter_manifests_sync(
+            urls, USER_AGENT, RateLimiter(REQUEST_DELAY, burst=REQUEST_BURST),
+            use_cache=use_cache, refresh=refresh,
+            retry_statuses=TRANSIENT_STATUSES, not_found=NOT_FOUND,
+        )
+        yield from zip(shelfmarks, manifests)
 
 
 # =============================================================================
@@ -293,7 +289,8 @@ def parse_manifest(manifest: dict, shelfmark: str) -> Optional[dict]:
         sequences = manifest.get("sequences", [])
         if sequences and sequences[0].get("canvases"):
             canvases = sequences[0]["canvases"]
-            record["image_count"] = len(canvases)
+            # Trimmed by load_manifest_subset to the first canvas plus a count
+            record["image_count"] = manifest.get("canvas_count", len(canvases))
 
             # Get thumbnail from first canvas
             first_canvas = canvases[0]
@@ -314,22 +311,19 @@ def parse_manifest(manifest: dict, shelfmark: str) -> Optional[dict]:
                 continue
 
             # Map metadata fields to database columns
-            if "title" in label:
-                record["contents"] = value
-            elif "language" in label:
-                record["language"] = value
-            elif "date" in label:
-                record["date_display"] = value
+            column = next(
+                (column for key, column in METADATA_FIELDS if key in label), None
+            )
+            if column is None:
+                continue
+            record[column] = value
+
+            if column == "date_display":
                 # Try to extract year range
-                years = re.findall(r'\b(1?\d{3})\b', value)
+                years = YEAR_PATTERN.findall(value)
                 if years:
                     record["date_start"] = int(years[0])
-                    if len(years) > 1:
-                        record["date_end"] = int(years[-1])
-                    else:
-                        record["date_end"] = int(years[0])
-            elif "extent" in label or "folio" in label:
-                record["folios"] = value
+                    record["date_end"] = int(years[-1])
 
         return record
 
@@ -361,26 +355,19 @@ def ensure_repository(cursor) -> int:
     return cursor.lastrowid
 
 
-def manuscript_exists(cursor, shelfmark: str, repo_id: int) -> Optional[int]:
-    """Check if manuscript already exists in database."""
-    cursor.execute(
-        "SELECT id FROM manuscripts WHERE shelfmark = ? AND repository_id = ?",
-        (shelfmark, repo_id)
-    )
-    row = cursor.fetchone()
-    return row[0] if row else None
+INSERT_SQL = """
+    INSERT INTO manuscripts (
+        repository_id, shelfmark, collection,
+        iiif_manifest_url, thumbnail_url, source_url,
+        date_display, date_start, date_end,
+        contents, language, provenance, folios, image_count
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
 
 
-def insert_manuscript(cursor, record: dict, repo_id: int) -> int:
-    """Insert manuscript record into database."""
-    cursor.execute("""
-        INSERT INTO manuscripts (
-            repository_id, shelfmark, collection,
-            iiif_manifest_url, thumbnail_url, source_url,
-            date_display, date_start, date_end,
-            contents, language, provenance, folios, image_count
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
+def manuscript_row(record: dict, repo_id: int) -> tuple:
+    """INSERT_SQL parameters for a parsed record."""
+    return (
         repo_id,
         record.get("shelfmark"),
         record.get("collection"),
@@ -395,9 +382,38 @@ def insert_manuscript(cursor, record: dict, repo_id: int) -> int:
         record.get("provenance"),
         record.get("folios"),
         record.get("image_count"),
-    ))
+    )
 
-    return cursor.lastrowid
+
+def commit_pending(conn, records: list[dict], repo_id: int, progress: dict) -> int:
+    """
+    Insert the pending records with one executemany and commit them.
+
+    Their shelfmarks are checkpointed only after the commit, and only when
+    every row was written, so --resume retries a batch that a crash rolled
+    back or that had a failing row (rows that did land are then skipped as
+    already in the database). The write lock is taken just for the batch,
+    not while manifests download. Empties records and returns the number
+    of rows that failed.
+    """
+    failed = 0
+    if records:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        failed = execute_batch(
+            cursor,
+            INSERT_SQL,
+            [manuscript_row(record, repo_id) for record in records],
+            [record["shelfmark"] for record in records],
+        )
+        conn.commit()
+        logger.info(f"Committed {len(records) - failed} manuscripts")
+    if not failed:
+        for record in records:
+            progress.record("C", record["shelfmark"])
+    progress.save()
+    records.clear()
+    return failed
 
 
 # =============================================================================
@@ -411,6 +427,8 @@ def import_trinity(
     verbose: bool = False,
     resume: bool = False,
     limit: Optional[int] = None,
+    use_cache: bool = True,
+    refresh: bool = False,
 ):
     """
     Main import function for Trinity College Cambridge manuscripts.
@@ -422,6 +440,8 @@ def import_trinity(
         verbose: Enable debug logging
         resume: Resume from last checkpoint
         limit: Maximum number of manuscripts to process
+        use_cache: Read and fill the on-disk manifest cache
+        refresh: Revalidate cached manifests with the server
     """
     if verbose:
         logger.setLevel(logging.DEBUG)
@@ -430,13 +450,14 @@ def import_trinity(
     CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
     # Load or initialize progress
-    progress = load_progress(PROGRESS_FILE) if resume else {
-        "last_updated": None,
-        "total_enumerated": 0,
-        "completed_shelfmarks": [],
-        "failed_shelfmarks": [],
-        "not_found_shelfmarks": [],
-    }
+    if resume:
+        progress = ImportProgress.load(
+            PROGRESS_FILE, PROGRESS_EVENTS, {"total_enumerated": 0},
+        )
+    else:
+        progress = ImportProgress(
+            PROGRESS_FILE, PROGRESS_EVENTS, {"total_enumerated": 0},
+        )
 
     # Phase 1: Enumeration (generate candidates from known ranges)
     logger.info("=" * 60)
@@ -449,7 +470,7 @@ def import_trinity(
     # Update progress
     progress["total_enumerated"] = len(shelfmarks)
     if not dry_run:
-        save_progress(progress, PROGRESS_FILE)
+        progress.save()
 
     # Apply test mode limit
     if test_mode:
@@ -473,27 +494,38 @@ def import_trinity(
 
     if resume and progress["completed_shelfmarks"]:
         logger.info(f"RESUME MODE - Skipping {len(progress['completed_shelfmarks'])} already completed")
-        logger.info(f"Not found in previous runs: {len(progress.get('not_found_shelfmarks', []))}")
+        logger.info(f"Not found in previous runs: {len(progress['not_found_shelfmarks'])}")
         logger.info(f"Failed in previous runs: {len(progress['failed_shelfmarks'])}")
 
     # Filter out already completed and not-found shelfmarks if resuming
     if resume:
         original_count = len(shelfmarks)
-        already_processed = set(progress["completed_shelfmarks"]) | set(progress.get("not_found_shelfmarks", []))
+        already_processed = progress["completed_shelfmarks"] | progress["not_found_shelfmarks"]
         shelfmarks = [s for s in shelfmarks if s not in already_processed]
         if len(shelfmarks) < original_count:
             logger.info(f"Resuming: {len(shelfmarks)} remaining of {original_count} total")
 
-    # Connect to database
-    conn = sqlite3.connect(db_path)
+    # Connect to database. When executing, inserts run in a short explicit
+    # transaction for every WRITE_BATCH_SIZE manuscripts.
+    conn = sqlite3.connect(db_path, isolation_level=None)
     cursor = conn.cursor()
 
     try:
-        repo_id = ensure_repository(cursor)
-        if not dry_run:
+        if dry_run:
+            cursor.execute(
+                "SELECT id FROM repositories WHERE short_name = ?", (REPO_SHORT,)
+            )
+            row = cursor.fetchone()
+            repo_id = row[0] if row else None
+        else:
+            tune_import_connection(conn)
+            cursor.execute("BEGIN IMMEDIATE")
+            repo_id = ensure_repository(cursor)
             conn.commit()
         logger.info(f"Repository ID: {repo_id}")
 
+        pending = []  # parsed records not yet inserted
+
         imported = 0
         skipped = 0
         not_found = 0
@@ -501,34 +533,36 @@ def import_trinity(
 
         total_to_process = len(shelfmarks)
 
-        for i, shelfmark in enumerate(shelfmarks, 1):
-            logger.info(f"[{i}/{total_to_process}] Processing {shelfmark}...")
-
-            # Check if already exists in database
-            existing_id = manuscript_exists(cursor, shelfmark, repo_id)
+        # Skip shelfmarks already in the database before fetching anything
+        existing = load_manuscript_ids(cursor, repo_id)
+        to_fetch = []
+        for shelfmark in shelfmarks:
+            existing_id = existing.get(shelfmark)
             if existing_id:
-                logger.info(f"  Already in database (ID {existing_id}), skipping")
+                logger.info(f"{shelfmark}: already in database (ID {existing_id}), skipping")
                 skipped += 1
                 if not dry_run:
-                    mark_completed(progress, shelfmark, PROGRESS_FILE)
-                continue
+                    progress.mark("C", shelfmark)
+            else:
+                to_fetch.append(shelfmark)
 
-            # Rate limit
-            time.sleep(REQUEST_DELAY)
+        manifests = fetch_all_manifests(to_fetch, use_cache=use_cache, refresh=refresh)
+        for i, (shelfmark, manifest) in enumerate(manifests, 1):
+            logger.info(f"[{i}/{len(to_fetch)}] Processing {shelfmark}...")
 
-            # Fetch manifest
-            manifest = fetch_manifest(shelfmark)
+            if manifest is NOT_FOUND:
+                # Not digitized; skipped on --resume
+                not_found += 1
+                if not dry_run:
+                    progress.mark("N", shelfmark)
+                continue
 
             if manifest is None:
-                # Could be 404 (not digitized) or actual error
-                # We track these separately
-                not_found += 1
+                # Network or server error; retried on --resume
+                logger.warning(f"  Failed to fetch manifest")
+                errors += 1
                 if not dry_run:
-                    if "not_found_shelfmarks" not in progress:
-                        progress["not_found_shelfmarks"] = []
-                    if shelfmark not in progress["not_found_shelfmarks"]:
-                        progress["not_found_shelfmarks"].append(shelfmark)
-                    save_progress(progress, PROGRESS_FILE)
+                    progress.mark("F", shelfmark)
                 continue
 
             # Parse manifest
@@ -538,7 +572,7 @@ def import_trinity(
                 logger.warning(f"  Failed to parse manifest")
                 errors += 1
                 if not dry_run:
-                    mark_failed(progress, shelfmark, PROGRESS_FILE)
+                    progress.mark("F", shelfmark)
                 continue
 
             # Log what we found
@@ -549,15 +583,22 @@ def import_trinity(
             logger.info(f"  Images: {record.get('image_count', 'N/A')}")
 
             if not dry_run:
-                ms_id = insert_manuscript(cursor, record, repo_id)
-                conn.commit()
-                logger.info(f"  Inserted as ID {ms_id}")
-                mark_completed(progress, shelfmark, PROGRESS_FILE)
-                imported += 1
+                pending.append(record)
+                if len(pending) >= WRITE_BATCH_SIZE:
+                    batch_size = len(pending)
+                    failed = commit_pending(conn, pending, repo_id, progress)
+                    imported += batch_size - failed
+                    errors += failed
             else:
                 logger.info(f"  Would insert (dry-run)")
                 imported += 1
 
+        if not dry_run:
+            batch_size = len(pending)
+            failed = commit_pending(conn, pending, repo_id, progress)
+            imported += batch_size - failed
+            errors += failed
+
         # Summary
         logger.info("=" * 60)
         logger.info("IMPORT SUMMARY")
@@ -570,7 +611,7 @@ def import_trinity(
 
         if not dry_run:
             total_completed = len(progress['completed_shelfmarks'])
-            total_not_found = len(progress.get('not_found_shelfmarks', []))
+            total_not_found = len(progress['not_found_shelfmarks'])
             total_enumerated = progress['total_enumerated']
             remaining = total_enumerated - total_completed - total_not_found
 
@@ -582,7 +623,7 @@ def import_trinity(
 
             if progress['failed_shelfmarks']:
                 logger.info(f"\nFailed shelfmarks ({len(progress['failed_shelfmarks'])}):")
-                for failed in progress['failed_shelfmarks'][:10]:
+                for failed in sorted(progress['failed_shelfmarks'])[:10]:
                     logger.info(f"  - {failed}")
                 if len(progress['failed_shelfmarks']) > 10:
                     logger.info(f"  ... and {len(progress['failed_shelfmarks']) - 10} more")
@@ -632,6 +673,16 @@ def main():
         default=None,
         help='Limit number of manuscripts to process'
     )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Bypass the on-disk manifest cache'
+    )
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='Revalidate cached manifests with the server'
+    )
 
     args = parser.parse_args()
 
@@ -643,6 +694,8 @@ def main():
             verbose=args.verbose,
             resume=args.resume,
             limit=args.limit,
+            use_cache=not args.no_cache,
+            refresh=args.refresh,
         )
     except KeyboardInterrupt:
         logger.info("\nInterrupted by user")
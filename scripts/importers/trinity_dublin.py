@@ -38,12 +38,20 @@ import sqlite3
 import sys
 import time
 import xml.etree.ElementTree as ET
-from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional
 from urllib.request import Request, urlopen
 from urllib.error import HTTPError, URLError
 
+from _iiif_utils import (
+    ImportProgress,
+    RateLimiter,
+    load_manuscript_ids,
+    tune_import_connection,
+    write_records,
+)
+
 # =============================================================================
 # Constants and Paths
 # =============================================================================
@@ -66,7 +74,9 @@ REPO_SHORT = "TCD"
 CATALOGUE_URL = "https://www.tcd.ie/library/manuscripts/"
 
 # Rate limiting
-REQUEST_DELAY = 0.5  # seconds between archive requests
+REQUEST_DELAY = 0.5  # seconds between archive requests (on average)
+CDX_DELAY = 0.3  # seconds between per-work CDX queries (on average)
+MAX_WORKERS = 8  # concurrent archive requests
 
 # Medieval manuscript MS number ranges (approximate)
 # TCD medieval manuscripts are generally MS 1-700 and some special collections
@@ -75,6 +85,18 @@ MEDIEVAL_MS_RANGES = [
     (10000, 11000), # Some medieval in this range
 ]
 
+# Patterns for shelfmarks, CDX capture URLs and Dublin Core dates
+MS_NUMBER_PATTERN = re.compile(r'MS\s*(\d+)', re.IGNORECASE)
+WORK_ID_PATTERN = re.compile(r'id=([a-z0-9]+)')
+YEAR_PATTERN = re.compile(r"\b(\d{4})\b")
+CENTURY_PATTERN = re.compile(r"(\d{1,2})(?:st|nd|rd|th)?\s*century", re.I)
+
+# Dublin Core XML namespaces
+DC_NAMESPACES = {
+    "dc": "http://purl.org/dc/elements/1.1/",
+    "dcterms": "http://purl.org/dc/terms/",
+}
+
 # EXCLUSIONS - manuscripts to skip
 EXCLUDED_MS_NUMBERS = {
     "58",  # Book of Kells - excluded per project requirements
@@ -124,43 +146,11 @@ def load_curated_whitelist(cache_path: Path = HTML_CURATED_CACHE) -> dict:
 # Progress/Checkpoint Management
 # =============================================================================
 
-
-def load_progress(progress_path: Path) -> dict:
-    """Load progress from checkpoint file."""
-    if not progress_path.exists():
-        return {
-            "last_updated": None,
-            "total_discovered": 0,
-            "completed_ids": [],
-            "failed_ids": [],
-            "phase": "discovery",
-        }
-    with open(progress_path) as f:
-        return json.load(f)
-
-
-def save_progress(progress: dict, progress_path: Path):
-    """Save progress to checkpoint file."""
-    progress["last_updated"] = datetime.now(timezone.utc).isoformat()
-    progress_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(progress_path, "w") as f:
-        json.dump(progress, f, indent=2)
-
-
-def mark_completed(progress: dict, work_id: str, progress_path: Path):
-    """Mark a work as completed and save checkpoint."""
-    if work_id not in progress["completed_ids"]:
-        progress["completed_ids"].append(work_id)
-    if work_id in progress["failed_ids"]:
-        progress["failed_ids"].remove(work_id)
-    save_progress(progress, progress_path)
-
-
-def mark_failed(progress: dict, work_id: str, progress_path: Path):
-    """Mark a work as failed and save checkpoint."""
-    if work_id not in progress["failed_ids"]:
-        progress["failed_ids"].append(work_id)
-    save_progress(progress, progress_path)
+# Outcome event kind -> checkpoint field (see _iiif_utils.ImportProgress).
+# The checkpoint is rewritten every PROGRESS_CHECKPOINT_EVERY items and at
+# the end of Phase 2; outcomes are appended to its event log in between.
+PROGRESS_EVENTS = {"C": "completed_ids", "F": "failed_ids"}
+PROGRESS_CHECKPOINT_EVERY = 100
 
 
 # =============================================================================
@@ -168,11 +158,20 @@ def mark_failed(progress: dict, work_id: str, progress_path: Path):
 # =============================================================================
 
 
-def fetch_url(url: str, retries: int = 3) -> Optional[str]:
-    """Fetch a URL and return content as string. Handles gzip compression."""
+def fetch_url(
+    url: str, retries: int = 3, limiter: Optional[RateLimiter] = None,
+) -> Optional[str]:
+    """
+    Fetch a URL and return content as string. Handles gzip compression.
+
+    If a limiter is given (it is shared by worker threads) every attempt
+    waits for its slot.
+    """
     import gzip
 
     for attempt in range(retries):
+        if limiter is not None:
+            limiter.wait()
         try:
             req = Request(url, headers={"User-Agent": USER_AGENT})
             with urlopen(req, timeout=60) as resp:
@@ -191,9 +190,11 @@ def fetch_url(url: str, retries: int = 3) -> Optional[str]:
     return None
 
 
-def fetch_json(url: str, retries: int = 3) -> Optional[list]:
+def fetch_json(
+    url: str, retries: int = 3, limiter: Optional[RateLimiter] = None,
+) -> Optional[list]:
     """Fetch a URL and parse as JSON."""
-    content = fetch_url(url, retries)
+    content = fetch_url(url, retries, limiter)
     if content:
         try:
             return json.loads(content)
@@ -211,7 +212,7 @@ def extract_ms_number(shelfmark: str) -> Optional[str]:
     """Extract MS number from shelfmark like 'IE TCD MS 94' -> '94'."""
     if not shelfmark:
         return None
-    match = re.search(r'MS\s*(\d+)', shelfmark, re.IGNORECASE)
+    match = MS_NUMBER_PATTERN.search(shelfmark)
     return match.group(1) if match else None
 
 
@@ -290,7 +291,7 @@ def discover_via_archive(
             continue
 
         # Extract work ID from URL
-        match = re.search(r'id=([a-z0-9]+)', url)
+        match = WORK_ID_PATTERN.search(url)
         if not match:
             continue
 
@@ -324,56 +325,60 @@ def discover_via_archive(
     return items
 
 
-def discover_specific_work_ids(work_ids: list[str]) -> list[dict]:
+def find_archived_capture(work_id: str, limiter: Optional[RateLimiter] = None) -> dict:
     """
-    Query Archive CDX API for specific work IDs to find their archived timestamps.
+    Query the Archive CDX API for one work's most recent successful capture.
 
-    Returns list of dicts with: work_id, timestamp, archived_url
+    Returns a dict with: work_id, timestamp, archived_url. Without a
+    successful capture, timestamp is None and the URL asks the Wayback
+    Machine for its latest copy.
     """
-    logger.info(f"Discovering Archive timestamps for {len(work_ids)} specific work IDs...")
-
-    items = []
-    for i, work_id in enumerate(work_ids):
-        if (i + 1) % 10 == 0:
-            logger.info(f"  Checking {i+1}/{len(work_ids)}...")
-
-        # Query CDX for this specific work
-        cdx_url = (
-            f"{WAYBACK_CDX}?url=digitalcollections.tcd.ie/export/dublinCore.xml?id={work_id}"
-            f"&output=json&limit=5"
-        )
-
-        data = fetch_json(cdx_url)
-        if not data or len(data) < 2:
-            # Try direct fetch with "id_" for most recent capture
-            items.append({
-                "work_id": work_id,
-                "timestamp": None,
-                "archived_url": f"{WAYBACK_WEB}/id_/{TCD_BASE}/export/dublinCore.xml?id={work_id}",
-            })
-            time.sleep(0.3)
-            continue
+    cdx_url = (
+        f"{WAYBACK_CDX}?url=digitalcollections.tcd.ie/export/dublinCore.xml?id={work_id}"
+        f"&output=json&limit=5"
+    )
 
+    data = fetch_json(cdx_url, limiter=limiter)
+    if data and len(data) >= 2:
         # Get most recent successful capture
         for row in reversed(data[1:]):
             timestamp = row[1]
             status = row[4]
             if status == "200":
-                items.append({
+                return {
                     "work_id": work_id,
                     "timestamp": timestamp,
                     "archived_url": f"{WAYBACK_WEB}/{timestamp}id_/{TCD_BASE}/export/dublinCore.xml?id={work_id}",
-                })
-                break
-        else:
-            # No successful capture found, try latest
-            items.append({
-                "work_id": work_id,
-                "timestamp": None,
-                "archived_url": f"{WAYBACK_WEB}/id_/{TCD_BASE}/export/dublinCore.xml?id={work_id}",
-            })
+                }
+
+    # No successful capture found, try latest with "id_" for raw content
+    return {
+        "work_id": work_id,
+        "timestamp": None,
+        "archived_url": f"{WAYBACK_WEB}/id_/{TCD_BASE}/export/dublinCore.xml?id={work_id}",
+    }
+
+
+def discover_specific_work_ids(work_ids: list[str]) -> list[dict]:
+    """
+    Query Archive CDX API for specific work IDs to find their archived timestamps.
+
+    Up to MAX_WORKERS queries run at once, paced to one per CDX_DELAY.
 
-        time.sleep(0.3)
+    Returns list of dicts with: work_id, timestamp, archived_url
+    """
+    logger.info(f"Discovering Archive timestamps for {len(work_ids)} specific work IDs...")
+
+    limiter = RateLimiter(CDX_DELAY)
+    items = []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        captures = executor.map(
+            lambda work_id: find_archived_capture(work_id, limiter), work_ids
+        )
+        for i, item in enumerate(captures):
+            if (i + 1) % 10 == 0:
+                logger.info(f"  Checking {i+1}/{len(work_ids)}...")
+            items.append(item)
 
     logger.info(f"  Found/created {len(items)} Archive URLs")
     return items
@@ -420,18 +425,12 @@ def parse_dublin_core_xml(xml_content: str, work_id: str) -> Optional[dict]:
         logger.warning(f"XML parse error for {work_id}: {e}")
         return None
 
-    # Namespace mapping
-    ns = {
-        "dc": "http://purl.org/dc/elements/1.1/",
-        "dcterms": "http://purl.org/dc/terms/",
-    }
-
     def get_text(tag: str, namespace: str = "dc") -> Optional[str]:
-        elem = root.find(f"{namespace}:{tag}", ns)
+        elem = root.find(f"{namespace}:{tag}", DC_NAMESPACES)
         return elem.text.strip() if elem is not None and elem.text else None
 
     def get_all_text(tag: str, namespace: str = "dc") -> list[str]:
-        elems = root.findall(f"{namespace}:{tag}", ns)
+        elems = root.findall(f"{namespace}:{tag}", DC_NAMESPACES)
         return [e.text.strip() for e in elems if e.text]
 
     # Extract identifiers
@@ -476,13 +475,13 @@ def parse_dublin_core_xml(xml_content: str, work_id: str) -> Optional[dict]:
     if date_created:
         record["date_display"] = date_created
         # Try to parse years
-        years = re.findall(r"\b(\d{4})\b", date_created)
+        years = YEAR_PATTERN.findall(date_created)
         if years:
             record["date_start"] = int(years[0])
             record["date_end"] = int(years[-1])
         else:
             # Try century pattern
-            century_match = re.search(r"(\d{1,2})(?:st|nd|rd|th)?\s*century", date_created, re.I)
+            century_match = CENTURY_PATTERN.search(date_created)
             if century_match:
                 c = int(century_match.group(1))
                 record["date_start"] = (c - 1) * 100
@@ -537,14 +536,36 @@ def ensure_repository(cursor) -> int:
     return cursor.lastrowid
 
 
-def manuscript_exists(cursor, shelfmark: str, repo_id: int) -> Optional[int]:
-    """Check if manuscript exists. Returns ID if found, None otherwise."""
-    cursor.execute(
-        "SELECT id FROM manuscripts WHERE shelfmark = ? AND repository_id = ?",
-        (shelfmark, repo_id),
+INSERT_SQL = """
+    INSERT INTO manuscripts (
+        repository_id, shelfmark, collection, date_display,
+        date_start, date_end, contents, language, provenance,
+        iiif_manifest_url, source_url
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+UPDATE_SQL = """
+    UPDATE manuscripts SET
+        collection = ?, date_display = ?, date_start = ?,
+        date_end = ?, contents = ?, language = ?,
+        provenance = ?, iiif_manifest_url = ?, source_url = ?
+    WHERE id = ?
+"""
+
+
+def record_fields(record: dict) -> tuple:
+    """Column values shared by INSERT_SQL and UPDATE_SQL, in statement order."""
+    return (
+        record.get("collection"),
+        record.get("date_display"),
+        record.get("date_start"),
+        record.get("date_end"),
+        record.get("contents"),
+        record.get("language"),
+        record.get("provenance"),
+        record["iiif_manifest_url"],
+        record.get("source_url"),
     )
-    row = cursor.fetchone()
-    return row[0] if row else None
 
 
 # =============================================================================
@@ -580,13 +601,13 @@ def import_tcd(
             return False
 
     # Load or initialize progress
-    progress = load_progress(PROGRESS_FILE) if resume else {
-        "last_updated": None,
-        "total_discovered": 0,
-        "completed_ids": [],
-        "failed_ids": [],
-        "phase": "discovery",
-    }
+    initial = {"total_discovered": 0, "phase": "discovery"}
+    if resume:
+        progress = ImportProgress.load(PROGRESS_FILE, PROGRESS_EVENTS, initial)
+    else:
+        progress = ImportProgress(PROGRESS_FILE, PROGRESS_EVENTS, initial)
+        if not dry_run:
+            progress.save()  # Start a fresh checkpoint and log
 
     # Phase 1: Discovery
     items = None
@@ -606,7 +627,7 @@ def import_tcd(
                 progress["total_discovered"] = len(items)
                 progress["phase"] = "import"
                 if not dry_run:
-                    save_progress(progress, PROGRESS_FILE)
+                    progress.save()
 
     if not items:
         logger.error("No items discovered")
@@ -675,62 +696,72 @@ def import_tcd(
 
     logger.info(f"\nPhase 2: Fetching {len(items_to_process)} Dublin Core XMLs from Archive...")
 
-    for i, item in enumerate(items_to_process):
-        work_id = item["work_id"]
-        archived_url = item["archived_url"]
-
-        logger.info(f"[{i+1}/{len(items_to_process)}] Fetching {work_id}...")
-
-        xml_content = fetch_url(archived_url)
+    # Worker threads fetch ahead (up to MAX_WORKERS at once, paced by a
+    # shared limiter); results are handled here in discovery order.
+    limiter = RateLimiter(REQUEST_DELAY)
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    xml_documents = executor.map(
+        lambda item: fetch_url(item["archived_url"], limiter=limiter),
+        items_to_process,
+    )
 
-        if not xml_content:
-            fetch_errors += 1
-            if not dry_run:
-                mark_failed(progress, work_id, PROGRESS_FILE)
-            logger.warning(f"  -> Failed to fetch")
-            time.sleep(REQUEST_DELAY)
-            continue
+    try:
+        for i, (item, xml_content) in enumerate(zip(items_to_process, xml_documents)):
+            work_id = item["work_id"]
 
-        # Check if we got HTML (error page) instead of XML
-        if xml_content.strip().startswith("<!DOCTYPE") or "<html" in xml_content[:500].lower():
-            fetch_errors += 1
-            if not dry_run:
-                mark_failed(progress, work_id, PROGRESS_FILE)
-            logger.warning(f"  -> Got HTML instead of XML (archive error)")
-            time.sleep(REQUEST_DELAY)
-            continue
+            logger.info(f"[{i+1}/{len(items_to_process)}] Fetched {work_id}")
 
-        record = parse_dublin_core_xml(xml_content, work_id)
+            if not xml_content:
+                fetch_errors += 1
+                if not dry_run:
+                    progress.mark("F", work_id)
+                logger.warning(f"  -> Failed to fetch")
+                continue
 
-        if record:
-            # Filter to medieval if requested
-            # Pass whitelist so curated items bypass MS range check
-            if medieval_only and not is_medieval_candidate(
-                record.get("shelfmark", ""), whitelist=whitelist, work_id=work_id
-            ):
-                skipped_non_medieval += 1
-                logger.debug(f"  -> Skipped (not medieval): {record.get('shelfmark')}")
+            # Check if we got HTML (error page) instead of XML
+            if xml_content.strip().startswith("<!DOCTYPE") or "<html" in xml_content[:500].lower():
+                fetch_errors += 1
                 if not dry_run:
-                    mark_completed(progress, work_id, PROGRESS_FILE)
-                time.sleep(REQUEST_DELAY)
+                    progress.mark("F", work_id)
+                logger.warning(f"  -> Got HTML instead of XML (archive error)")
                 continue
 
-            records.append(record)
-            if not dry_run:
-                mark_completed(progress, work_id, PROGRESS_FILE)
-            logger.info(f"  -> {record['shelfmark']}: {record.get('contents', '')[:50]}")
-        else:
-            if not dry_run:
-                mark_completed(progress, work_id, PROGRESS_FILE)  # Mark as done even if excluded
-
-        # Progress logging
-        if (i + 1) % 25 == 0:
-            logger.info(
-                f"Progress: {i+1}/{len(items_to_process)}, "
-                f"{len(records)} parsed, {fetch_errors} errors, {skipped_non_medieval} non-medieval"
-            )
+            record = parse_dublin_core_xml(xml_content, work_id)
+
+            if record:
+                # Filter to medieval if requested
+                # Pass whitelist so curated items bypass MS range check
+                if medieval_only and not is_medieval_candidate(
+                    record.get("shelfmark", ""), whitelist=whitelist, work_id=work_id
+                ):
+                    skipped_non_medieval += 1
+                    logger.debug(f"  -> Skipped (not medieval): {record.get('shelfmark')}")
+                    if not dry_run:
+                        progress.mark("C", work_id)
+                    continue
+
+                records.append(record)
+                if not dry_run:
+                    progress.mark("C", work_id)
+                logger.info(f"  -> {record['shelfmark']}: {record.get('contents', '')[:50]}")
+            else:
+                if not dry_run:
+                    progress.mark("C", work_id)  # Mark as done even if excluded
+
+            # Progress logging and checkpoint
+            if (i + 1) % 25 == 0:
+                logger.info(
+                    f"Progress: {i+1}/{len(items_to_process)}, "
+                    f"{len(records)} parsed, {fetch_errors} errors, {skipped_non_medieval} non-medieval"
+                )
+            if not dry_run and (i + 1) % PROGRESS_CHECKPOINT_EVERY == 0:
+                progress.save()
+    finally:
+        # On interrupt, drop fetches that have not started yet
+        executor.shutdown(wait=True, cancel_futures=True)
 
-        time.sleep(REQUEST_DELAY)
+    if not dry_run:
+        progress.save()
 
     logger.info(
         f"\nFetched {len(items_to_process)} items, "
@@ -741,13 +772,10 @@ def import_tcd(
     # Phase 3: Database operations
     logger.info("\nPhase 3: Database operations...")
 
-    conn = sqlite3.connect(db_path)
+    # All writes go in one transaction, with one executemany per statement
+    conn = sqlite3.connect(db_path, isolation_level=None)
     cursor = conn.cursor()
 
-    repo_id = ensure_repository(cursor) if not dry_run else 1
-    if not dry_run:
-        conn.commit()
-
     stats = {
         "total_discovered": progress.get("total_discovered", len(items)),
         "items_processed": len(items_to_process),
@@ -761,80 +789,40 @@ def import_tcd(
 
     results = {"inserted": [], "updated": []}
 
-    for record in records:
-        shelfmark = record["shelfmark"]
-
+    try:
         if dry_run:
             cursor.execute(
-                "SELECT id FROM manuscripts WHERE shelfmark = ?",
-                (shelfmark,),
+                "SELECT id FROM repositories WHERE short_name = ?", (REPO_SHORT,)
             )
-            if cursor.fetchone():
-                stats["updated"] += 1
-                results["updated"].append(record)
-            else:
-                stats["inserted"] += 1
-                results["inserted"].append(record)
-        else:
-            try:
-                existing_id = manuscript_exists(cursor, shelfmark, repo_id)
-
-                if existing_id:
-                    cursor.execute(
-                        """
-                        UPDATE manuscripts SET
-                            collection = ?, date_display = ?, date_start = ?,
-                            date_end = ?, contents = ?, language = ?,
-                            provenance = ?, iiif_manifest_url = ?, source_url = ?
-                        WHERE id = ?
-                    """,
-                        (
-                            record.get("collection"),
-                            record.get("date_display"),
-                            record.get("date_start"),
-                            record.get("date_end"),
-                            record.get("contents"),
-                            record.get("language"),
-                            record.get("provenance"),
-                            record["iiif_manifest_url"],
-                            record.get("source_url"),
-                            existing_id,
-                        ),
-                    )
+            row = cursor.fetchone()
+            existing = load_manuscript_ids(cursor, row[0]) if row else {}
+            for record in records:
+                if record["shelfmark"] in existing:
                     stats["updated"] += 1
+                    results["updated"].append(record)
                 else:
-                    cursor.execute(
-                        """
-                        INSERT INTO manuscripts (
-                            repository_id, shelfmark, collection, date_display,
-                            date_start, date_end, contents, language, provenance,
-                            iiif_manifest_url, source_url
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                        (
-                            repo_id,
-                            shelfmark,
-                            record.get("collection"),
-                            record.get("date_display"),
-                            record.get("date_start"),
-                            record.get("date_end"),
-                            record.get("contents"),
-                            record.get("language"),
-                            record.get("provenance"),
-                            record["iiif_manifest_url"],
-                            record.get("source_url"),
-                        ),
-                    )
                     stats["inserted"] += 1
-
-            except Exception as e:
-                stats["db_errors"] += 1
-                logger.error(f"Error importing {shelfmark}: {e}")
-
-    if not dry_run:
-        conn.commit()
-        logger.info(f"Committed {stats['inserted']} inserts, {stats['updated']} updates")
-    conn.close()
+                    results["inserted"].append(record)
+        else:
+            tune_import_connection(conn)
+            cursor.execute("BEGIN IMMEDIATE")
+            repo_id = ensure_repository(cursor)
+            existing = load_manuscript_ids(cursor, repo_id)
+            inserted, updated, failed = write_records(
+                cursor, records, repo_id, existing,
+                INSERT_SQL, UPDATE_SQL, record_fields,
+            )
+            stats["inserted"] += inserted
+            stats["updated"] += updated
+            stats["db_errors"] += failed
+            conn.commit()
+            logger.info(f"Committed {stats['inserted']} inserts, {stats['updated']} updates")
+    except BaseException:
+        if not dry_run:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
 
     # Print summary
     print("\n" + "=" * 70)
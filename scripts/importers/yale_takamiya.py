@@ -219,12 +219,13 @@ def get_label_value(label_obj) -> str:
 
 def extract_v3_metadata_value(metadata: list, label: str) -> Optional[str]:
     """Extract a value from IIIF v3 metadata array by label."""
+    label_norm = label.lower().strip()
     if not metadata:
         return None
 
     for entry in metadata:
         entry_label = get_label_value(entry.get("label", {}))
-        if entry_label.lower().strip() == label.lower().strip():
+        if entry_label.lower().strip() == label_norm:
             value = get_label_value(entry.get("value", {}))
             if value:
                 # Strip HTML tags